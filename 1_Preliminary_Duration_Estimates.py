@@ -1,47 +1,60 @@
 import numpy as np
 import pandas as pd
-import scipy.stats as stats
 import plotly.graph_objects as go
 import streamlit as st
 
-#from numpy.random import default_rng
-#rng = default_rng(17)
-np.random.seed(7)
-
-#todo: move common functions to separate module
-def simulate(p, trials, alpha, beta):
-    trials_conv = stats.binom.rvs(n=trials, p=p)
-    trials_accum = np.cumsum(trials)
-    trials_conv_accum = np.cumsum(trials_conv)
-    alpha_post = trials_conv_accum + alpha
-    beta_post = (trials_accum - trials_conv_accum) + beta
-    s = {
-        'p': p,
-        'trials_accum': trials_accum,
-        'trials_conv_accum': trials_conv_accum,
-        'alpha_post': alpha_post,
-        'beta_post': beta_post
-    }
-    return s 
-
-def pb_ge_pa_sims(s_a, s_b, n_cmp=30000):
-    n_pars = len(s_a['alpha_post'])
-    pa = stats.beta.rvs(s_a['alpha_post'], s_a['beta_post'], size=(n_cmp, n_pars))
-    pb = stats.beta.rvs(s_b['alpha_post'], s_b['beta_post'], size=(n_cmp, n_pars))
-    return np.sum(pb >= pa, axis=0) / n_cmp
-
-def min_days_to_reach_certainty_level(probs_pb_ge_pa, days, required_pb_ge_pa):
-    prob_gt_required = (probs_pb_ge_pa > required_pb_ge_pa) | (probs_pb_ge_pa < 1 - required_pb_ge_pa)
-    reached = days[prob_gt_required]
-    min_reached = np.min(reached) if prob_gt_required[-1] else np.max(days)
-    return min_reached
-    
-def beta_dist_mean_std_to_alpha_beta(mean, std):
-    var = std**2
-    nu = mean * (1 - mean) / var - 1
-    alpha = mean * nu
-    beta = (1 - mean) * nu
-    return alpha, beta
+from coinflip.compare import pb_gt_pa
+from coinflip.lookup import check_error, interpolate_durations, load_table, table_path
+from coinflip.plotting import DENSITY_POINTS, density_grid
+from coinflip.posterior import beta_dist_mean_std_to_alpha_beta, beta_pdf
+from coinflip.profiling import Profiler, profiling_enabled
+from coinflip.simulation import min_days_to_reach_certainty_level, min_days_to_reach_p_best
+from coinflip.ui import (ARMS_N_CMP, CACHE_MAX_ENTRIES, GROUPS, SEED, days_to_certainty_figure,
+                         run_arm_simulations, run_duration_simulations, run_duration_sweep, run_with_progress)
+
+EXTRA_GROUP_DEFAULTS = {'mean': 15.0, 'std': 0.5}
+
+@st.cache_resource
+def duration_table(path):
+    return load_table(path) if path else None
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def prior_figure(groups, means, stds, n_points=DENSITY_POINTS):
+    fig = go.Figure()
+    for group, mean, std in zip(groups, means, stds):
+        alpha, beta = beta_dist_mean_std_to_alpha_beta(mean, std)
+        x = density_grid(mean, std, n_points)
+        fig.add_trace(go.Scatter(x=x * 100, y=beta_pdf(x, alpha, beta),
+                                 mode='lines',
+                                 name=f"{group}: mean = {mean * 100:.1f} %, std = {(std * 100):.2f} %"))
+    fig.update_layout(title='A Priori Conversions',
+                      xaxis_title='Conversions, %',
+                      yaxis_title='Prob Density',
+                      hovermode="x",
+                      height=550)
+    xrange_min = np.floor(np.min(np.subtract(means, np.multiply(stds, 5))) * 100)
+    xrange_max = np.ceil(np.max(np.add(means, np.multiply(stds, 5))) * 100)
+    fig.update_xaxes(range=[xrange_min, xrange_max])
+    return fig
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def sweep_figure(daily_users, b_split, median_days, reached_share, pb_gt_pa_required):
+    fig = go.Figure()
+    fig.add_trace(go.Heatmap(x=[f'{x * 100:.0f}%' for x in b_split],
+                             y=[str(x) for x in daily_users],
+                             z=median_days,
+                             customdata=reached_share * 100,
+                             text=median_days,
+                             texttemplate='%{text:.0f}',
+                             colorscale='Reds',
+                             colorbar_title='Days',
+                             hovertemplate='Daily users: %{y}<br>B traffic: %{x}<br>'
+                                           'Median days: %{z:.1f}<br>Reached: %{customdata:.0f}%'
+                                           '<extra></extra>'))
+    fig.update_layout(title=f'Median Days to Reach {pb_gt_pa_required*100:.0f}% Certainty',
+                      xaxis_title='B Group Traffic',
+                      yaxis_title='Daily Users')
+    return fig
 
 def init_session_values():
     if 'prelim_a_mean' not in st.session_state:
@@ -62,25 +75,61 @@ def init_session_values():
         st.session_state['prelim_sim_daily_users'] = 5000
     if 'prelim_n_simulations' not in st.session_state:
         st.session_state['prelim_n_simulations'] = 100
+    if 'prelim_n_groups' not in st.session_state:
+        st.session_state['prelim_n_groups'] = 2
+    if 'diagnostics' not in st.session_state:
+        st.session_state['diagnostics'] = profiling_enabled()
+    if 'prelim_live' not in st.session_state:
+        st.session_state['prelim_live'] = False
+    if 'prelim_sweep' not in st.session_state:
+        st.session_state['prelim_sweep'] = False
+    if 'prelim_sweep_daily_users' not in st.session_state:
+        st.session_state['prelim_sweep_daily_users'] = (1000, 10000)
+    if 'prelim_sweep_daily_users_steps' not in st.session_state:
+        st.session_state['prelim_sweep_daily_users_steps'] = 5
+    if 'prelim_sweep_b_split' not in st.session_state:
+        st.session_state['prelim_sweep_b_split'] = (10, 90)
+    if 'prelim_sweep_b_split_steps' not in st.session_state:
+        st.session_state['prelim_sweep_b_split_steps'] = 5
+    for x in GROUPS[2:]:
+        for stat, default in EXTRA_GROUP_DEFAULTS.items():
+            if f'prelim_{x.lower()}_{stat}' not in st.session_state:
+                st.session_state[f'prelim_{x.lower()}_{stat}'] = default
         
 
 init_session_values()
 
+st.sidebar.checkbox(label='Diagnostics', key='diagnostics')
+profiler = Profiler(enabled=st.session_state['diagnostics'])
+
 st.title('Preliminary Duration Estimates')
 
 #todo: choose what to test: conversions, means, etc'
 summary_container = st.container()
+expected_lines = "  \n".join(
+    f"Expected group {x} conversion: {st.session_state[f'prelim_{x.lower()}_mean']}%"
+    for x in GROUPS[:st.session_state['prelim_n_groups']])
+if st.session_state['prelim_n_groups'] == 2:
+    traffic_line = f"Group B traffic: {st.session_state['prelim_b_split']:.0f}%"
+else:
+    traffic_line = f"Traffic per group: {100 / st.session_state['prelim_n_groups']:.1f}%"
 summary_container.write(f"""
-    Expected group A conversion: {st.session_state['prelim_a_mean']}%  
-    Expected group B conversion: {st.session_state['prelim_b_mean']}%    
+    {expected_lines}    
       
     Daily users: {st.session_state['prelim_sim_daily_users']}  
-    Group B traffic: {st.session_state['prelim_b_split']:.0f}%   
+    {traffic_line}   
 """)
-summary_bar = summary_container.progress(0)
 
 st.subheader("A Priori Conversions")
 
+st.number_input(label='Groups',
+                min_value=2,
+                max_value=len(GROUPS),
+                step=1,
+                format='%d',
+                key='prelim_n_groups')
+groups = GROUPS[:st.session_state['prelim_n_groups']]
+
 col1, col2 = st.columns(2)
 
 with col1:
@@ -109,28 +158,27 @@ with col2:
                     format='%f',
                     key='prelim_b_std')
 
-a_mean, a_std = st.session_state['prelim_a_mean']/100, st.session_state['prelim_a_std']/100
-b_mean, b_std = st.session_state['prelim_b_mean']/100, st.session_state['prelim_b_std']/100
-a_alpha, a_beta = beta_dist_mean_std_to_alpha_beta(a_mean, a_std)
-b_alpha, b_beta = beta_dist_mean_std_to_alpha_beta(b_mean, b_std)
-
-x = np.linspace(0, 1, 3001)
-fig = go.Figure()
-fig.add_trace(go.Scatter(x=x * 100, y=stats.beta.pdf(x, a_alpha, a_beta),
-                         mode='lines',
-                         name=f"A: mean = {a_mean * 100:.1f} %, std = {(a_std * 100):.2f} %"))
-fig.add_trace(go.Scatter(x=x * 100, y=stats.beta.pdf(x, b_alpha, b_beta),
-                         mode='lines',
-                         name=f"B: mean = {b_mean * 100:.1f} %, std = {(b_std * 100):.2f} %"))
-fig.update_layout(title='A Priori Conversions',
-                  xaxis_title='Conversions, %',
-                  yaxis_title='Prob Density',
-                  hovermode="x",
-                  height=550)
-xrange_min = np.floor(np.min([a_mean - 5 * a_std, b_mean - 5 * b_std]) * 100)
-xrange_max = np.ceil(np.max([a_mean + 5 * a_std, b_mean + 5 * b_std]) * 100)
-fig.update_xaxes(range=[xrange_min, xrange_max])
-st.plotly_chart(fig)
+for i, x in enumerate(groups[2:]):
+    with (col1, col2)[i % 2]:
+        st.number_input(label=f'{x} Mean, %',
+                        min_value=0.0,
+                        max_value=100.0,
+                        step=0.1,
+                        format='%f',
+                        key=f'prelim_{x.lower()}_mean')
+        st.number_input(label=f'{x} Std, %',
+                        min_value=0.01,
+                        step=0.01,
+                        format='%f',
+                        key=f'prelim_{x.lower()}_std')
+
+means = tuple(st.session_state[f'prelim_{x.lower()}_mean']/100 for x in groups)
+stds = tuple(st.session_state[f'prelim_{x.lower()}_std']/100 for x in groups)
+alphas, betas = beta_dist_mean_std_to_alpha_beta(np.array(means), np.array(stds))
+(a_alpha, b_alpha), (a_beta, b_beta) = alphas[:2], betas[:2]
+
+with profiler.stage('figures'):
+    st.plotly_chart(prior_figure(groups, means, stds))
 
 
 st.subheader("Duration Estimates")
@@ -150,11 +198,14 @@ with col1:
                     format='%d',
                     key='prelim_sim_max_days')
 with col2:
-    st.number_input(label='B Group Traffic, %',
-                    min_value=0.0,
-                    step=1.0,
-                    format='%f',
-                    key='prelim_b_split')
+    if len(groups) == 2:
+        st.number_input(label='B Group Traffic, %',
+                        min_value=0.0,
+                        step=1.0,
+                        format='%f',
+                        key='prelim_b_split')
+    else:
+        st.caption(f'Traffic is split equally, {100 / len(groups):.1f}% per group')
 
     st.number_input(label='Simulations',
                     min_value=1,
@@ -168,78 +219,148 @@ st.number_input(label='Required Certainty, %',
                 format='%f',
                 key='prelim_pb_gt_pa_required')
 
+table = duration_table(table_path())
+if len(groups) == 2 and table is not None:
+    st.checkbox(label='Live Simulation', key='prelim_live',
+                help='Simulate instead of interpolating in the precomputed duration table')
+
 b_split = st.session_state['prelim_b_split'] / 100
 n_simulations = st.session_state['prelim_n_simulations']
 pb_gt_pa_required = st.session_state['prelim_pb_gt_pa_required'] / 100
+# read here, the simulations run off the script thread without session state
+daily_users = st.session_state['prelim_sim_daily_users']
+max_days = st.session_state['prelim_sim_max_days']
 
-sim_max = st.session_state['prelim_sim_max_days'] * st.session_state['prelim_sim_daily_users']
-n_sim_steps = st.session_state['prelim_sim_max_days']
-
-a_prior = stats.beta(a_alpha, a_beta)
-b_prior = stats.beta(b_alpha, b_beta)
-a_p_sim = a_prior.rvs(n_simulations)
-b_p_sim = b_prior.rvs(n_simulations)
-
-trials = np.append(0, np.full(fill_value=st.session_state['prelim_sim_daily_users'],
-                              shape=st.session_state['prelim_sim_max_days']))
-a_trials = np.rint(trials * (1 - b_split)).astype(int)
-b_trials = np.rint(trials * b_split).astype(int)
-
-i = 0
-with st.spinner(text=f'Running {n_simulations} simulations ...'):
-    my_bar = st.progress(0)
-    sims = []
-    for a_p, b_p in zip(a_p_sim, b_p_sim):
-        s = {}
-        s['A'] = simulate(a_p, a_trials, a_alpha, a_beta)
-        s['B'] = simulate(b_p, b_trials, b_alpha, b_beta)
-        s['pb_ge_pa'] = pb_ge_pa_sims(s['A'], s['B'], n_cmp=10000)
-        s['days'] = np.arange(st.session_state['prelim_sim_max_days'] + 1)
-        s['N'] = s['A']['trials_accum'] + s['B']['trials_accum']
-        s['pb_gt_pa_required'] = st.session_state['prelim_pb_gt_pa_required'] / 100
-        s['min_days_to_reach_certainty_lvl'] = min_days_to_reach_certainty_level(s['pb_ge_pa'], s['days'], s['pb_gt_pa_required'])
-        sims.append(s)
-        i = i + 1
-        my_bar.progress(i / n_simulations)
-        summary_bar.progress(i / n_simulations)
-my_bar.empty()
-summary_bar.empty()
-
-n_reached_hist = [s['min_days_to_reach_certainty_lvl'] for s in sims]
-n_reached_freqs = pd.Series(n_reached_hist).value_counts(normalize=True).rename('freq').to_frame()
-x_med = np.median(n_reached_hist)
-if len(n_reached_freqs['freq']) == 1:
-    summary_line = f"100% simulations reached certainty at day {n_reached_freqs.index[0]}"
+# two groups inside the precomputed table are answered without simulating
+estimate = None
+if len(groups) == 2 and table is not None and not st.session_state['prelim_live'] and means[0] > 0:
+    estimate = interpolate_durations(table, means[0], means[1] / means[0] - 1, stds[0], stds[1],
+                                     daily_users, b_split, pb_gt_pa_required, max_days)
+    # without a reliable median, too few simulations reach certainty in time
+    if estimate is not None and not estimate['reported'][list(table['quantiles']).index(0.5)]:
+        estimate = None
+
+if estimate is not None:
+    median_error = check_error(table)
+    prior_line = f"Prior P(p_B > p_A): {pb_gt_pa(a_alpha, a_beta, b_alpha, b_beta) * 100:.1f}%"
+    summary_line = (f"50% simulations reach {pb_gt_pa_required*100:.0f}% certainty "
+                    f"at day {estimate['median_days']:.0f} or earlier")
 else:
-    summary_line = f"50% simulations reached {pb_gt_pa_required*100:.0f}% certainty at day {x_med:.0f} or earlier"
-prior_pb_gt_pa = sims[0]['pb_ge_pa'][0] #simplify
+    with profiler.stage('duration_simulations'):
+        if len(groups) == 2:
+            sims = run_with_progress(f'Running {n_simulations} simulations ...',
+                                     run_duration_simulations, a_alpha, a_beta, b_alpha, b_beta,
+                                     daily_users,
+                                     b_split,
+                                     max_days,
+                                     n_simulations, SEED, method='auto', n_workers=1,
+                                     trajectories=False)
+            profiler.count_paths('P(B>A)', sims['path_counts'])
+            n_reached_hist = min_days_to_reach_certainty_level(sims['pb_ge_pa'], sims['days'], pb_gt_pa_required)
+            prior_line = f"Prior P(p_B > p_A): {sims['pb_ge_pa'][0, 0] * 100:.1f}%"
+        else:
+            sims = run_with_progress(f'Running {n_simulations} simulations ...',
+                                     run_arm_simulations, alphas, betas,
+                                     daily_users,
+                                     [1 / len(groups)] * len(groups),
+                                     max_days,
+                                     n_simulations, SEED, n_cmp=ARMS_N_CMP, n_workers=1,
+                                     trajectories=False)
+            n_reached_hist = min_days_to_reach_p_best(sims['p_best'], sims['days'], pb_gt_pa_required)
+            prior_line = "Prior P(best): " + ", ".join(
+                f"{x} {p * 100:.1f}%" for x, p in zip(groups, sims['p_best'][0, 0]))
+
+    n_reached_freqs = pd.Series(n_reached_hist).value_counts(normalize=True).rename('freq').to_frame()
+    x_med = np.median(n_reached_hist)
+    if len(n_reached_freqs['freq']) == 1:
+        summary_line = f"100% simulations reached certainty at day {n_reached_freqs.index[0]}"
+    else:
+        summary_line = f"50% simulations reached {pb_gt_pa_required*100:.0f}% certainty at day {x_med:.0f} or earlier"
 
 summary_container.write(f"""
-    Prior P(p_B > p_A): {prior_pb_gt_pa * 100:.1f}%    
+    {prior_line}    
     Required certainty: {st.session_state['prelim_pb_gt_pa_required']}%  
     {summary_line}
 """)
 
-fig = go.Figure()
-fig.add_trace(go.Bar(x=n_reached_freqs.index,
-                     y=n_reached_freqs['freq'],
-                     width=[1] * len(n_reached_freqs),
-                     marker_color='red',
-                     opacity=0.6,
-                     name='Simulations Reached Certainty'))
-fig.add_trace(go.Scatter(x=[x_med, x_med], y=[0, np.max(n_reached_freqs['freq'])], 
-                         line_color='black',
-                         line_dash='dash',
-                         mode='lines',
-                         hovertemplate=f"Median: {x_med}",
-                         name='Median'))              
-fig.update_layout(title=f'Days to Reach {pb_gt_pa_required*100:.0f}% Certainty')
-fig.update_layout(xaxis_title='Days',
-                  yaxis_title='Part from Total Simulations',
-                  showlegend=False)
-fig.update_xaxes(range=[0, st.session_state['prelim_sim_max_days'] + 1])
-fig.update_layout(yaxis_rangemode='tozero')
-st.plotly_chart(fig)
+if estimate is not None:
+    reported = estimate['reported']
+    errors = [check_error(table, q) for q in table['quantiles'][reported]]
+    st.dataframe(pd.DataFrame({'Simulations, %': table['quantiles'][reported] * 100,
+                               'Days or Earlier': estimate['days'][reported].round(1),
+                               'Measured Error, 95th Percentile, Days':
+                                   [np.quantile(e, 0.95).round(1) if e.size else np.nan for e in errors]})
+                 .set_index('Simulations, %'))
+    st.caption(f"Interpolated in the duration table ({table['n_simulations']} simulations per cell); "
+               f"{estimate['reached_share'] * 100:.0f}% of simulations reach certainty within "
+               f"{table['max_days']} days, higher shares are not estimated from the table. Errors are "
+               f"measured against live simulations of random points of the table, the median is "
+               f"typically off by {np.median(median_error):.1f} days. "
+               f"Check 'Live Simulation' for the full distribution.")
+else:
+    if len(groups) == 2 and table is not None and not st.session_state['prelim_live']:
+        st.caption('Outside the precomputed duration table or too few simulations in it reach '
+                   'certainty in time, simulated live.')
+    with profiler.stage('figures'):
+        st.plotly_chart(days_to_certainty_figure(n_reached_freqs, x_med, pb_gt_pa_required,
+                                                 st.session_state['prelim_sim_max_days']))
+
+if len(groups) == 2:
+    st.subheader("Traffic Sweep")
+    st.checkbox(label='Sweep Daily Users and B Group Traffic', key='prelim_sweep')
+
+if len(groups) == 2 and st.session_state['prelim_sweep']:
+    col1, col2 = st.columns(2)
+    with col1:
+        st.slider(label='Daily Users',
+                  min_value=100,
+                  max_value=100000,
+                  step=100,
+                  key='prelim_sweep_daily_users')
+        st.number_input(label='Daily Users Steps',
+                        min_value=1,
+                        max_value=20,
+                        step=1,
+                        format='%d',
+                        key='prelim_sweep_daily_users_steps')
+    with col2:
+        st.slider(label='B Group Traffic, %',
+                  min_value=1,
+                  max_value=99,
+                  step=1,
+                  key='prelim_sweep_b_split')
+        st.number_input(label='B Group Traffic Steps',
+                        min_value=1,
+                        max_value=20,
+                        step=1,
+                        format='%d',
+                        key='prelim_sweep_b_split_steps')
+    sweep_daily_users = np.unique(np.rint(np.linspace(*st.session_state['prelim_sweep_daily_users'],
+                                                      st.session_state['prelim_sweep_daily_users_steps'])).astype(int))
+    sweep_b_split = np.unique(np.linspace(*st.session_state['prelim_sweep_b_split'],
+                                          st.session_state['prelim_sweep_b_split_steps']).round()) / 100
+    with profiler.stage('sweep'):
+        sweep = run_with_progress(
+            f'Running {n_simulations} simulations for {sweep_daily_users.size * sweep_b_split.size} cells ...',
+            run_duration_sweep, a_alpha, a_beta, b_alpha, b_beta,
+            sweep_daily_users, sweep_b_split,
+            max_days,
+            n_simulations, SEED, pb_gt_pa_required, method='auto',
+            n_workers=1)
+    profiler.count_paths('Sweep P(B>A)', sweep['path_counts'])
+    with profiler.stage('figures'):
+        st.plotly_chart(sweep_figure(sweep['daily_users'], sweep['b_split'],
+                                     sweep['median_days'], sweep['reached_share'], pb_gt_pa_required))
+    st.caption('All cells share the same prior draws and random variates, '
+               'so differences between cells come from traffic, not from noise.')
+
+if profiler.enabled:
+    record = profiler.finish('Preliminary Duration Estimates')
+    with st.expander("Diagnostics"):
+        st.dataframe(pd.DataFrame(record['stages']).set_index('stage').round(3))
+        st.caption(f"Total {record['total_seconds']:.2f} s")
+        for line in profiler.path_shares():
+            st.caption(line)
 
 st.markdown('---')
 st.write("Sources: https://github.com/noooway/Coinflip")
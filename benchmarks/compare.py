@@ -0,0 +1,42 @@
+"""Compare two benchmark reports written by benchmarks/run.py.
+
+    python benchmarks/compare.py old.json new.json [--threshold 1.1]
+
+Exits with status 1 if any case got slower than threshold times.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        report = json.load(f)
+    return report, {(r['name'], json.dumps(r['params'], sort_keys=True)): r for r in report['results']}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=1.1)
+    args = parser.parse_args(argv)
+
+    old_report, old = load(args.old)
+    new_report, new = load(args.new)
+    print(f"{old_report['revision']} -> {new_report['revision']}")
+    regressions = 0
+    for key in sorted(old.keys() & new.keys()):
+        ratio = new[key]['seconds'] / old[key]['seconds']
+        mem_ratio = new[key]['peak_mb'] / max(old[key]['peak_mb'], 1e-9)
+        flag = ''
+        if ratio > args.threshold:
+            flag = 'SLOWER'
+            regressions += 1
+        print(f"{key[0]:22s} {key[1]:60s} {old[key]['seconds']:9.4f} -> {new[key]['seconds']:9.4f} s "
+              f"x{ratio:5.2f}  mem x{mem_ratio:5.2f} {flag}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,348 @@
+"""Load test of both Streamlit pages with concurrent headless sessions.
+
+    python benchmarks/loadtest.py --output loadtest.json [--quick] [--mode server]
+
+For every level of (page, concurrent sessions, n_simulations) each session
+loads the page, waits for the others, then replays a sequence of widget
+changes an analyst would make (traffic, means, certainty, groups, going
+back to an earlier input) with values drawn per session, and times every
+rerun. Per level it reports rerun latency percentiles, reruns per second
+over all sessions and peak RSS.
+
+--mode server (default) starts one `streamlit run` server per level and
+connects that many websocket clients to it at once, as browser tabs do,
+so the sessions contend for the GIL, the background runs and the CPUs
+of one server process and share its caches. A client sends the widget
+values it has set with every rerun and times it until the script
+finishes; the page is not rendered. 'rss_mb' is the server peak,
+'import_rss_mb' the server before the first session, which has not
+imported the pages yet, and 'session_rss_mb' the growth divided by the
+sessions. Needs Linux for /proc and the websockets package, which recent
+Streamlit versions install.
+
+The other modes drive the pages with AppTest and only give the cost of
+a session on its own. --mode processes runs each session in its own
+process, as AppTest is not thread-safe, so sessions only contend for the
+CPUs; 'rss_mb' sums the session peaks, 'import_rss_mb' is one session
+before its first run. --mode in_process keeps all sessions in one process
+taking turns: every session applies its first change, then every
+session its second, and so on, showing the memory of one process holding
+all sessions and the caches and runs they share, without overlapping
+reruns.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PAGES = ['1_Preliminary_Duration_Estimates.py', 'pages/2_Conversions.py']
+CONCURRENCY = [1, 2, 4, 8]
+SIMULATIONS = [100, 1000, 5000]
+QUICK_CONCURRENCY = [1, 2]
+QUICK_SIMULATIONS = [100]
+PERCENTILES = [50, 95, 99]
+TIMEOUT = 3600
+SERVER_START_TIMEOUT = 60
+MODES = {
+    'server': "concurrent sessions of one streamlit server process",
+    'processes': "cost of a session on its own: one process per session, sessions share only the CPUs",
+    'in_process': "cost of a session on its own: sessions of one process taking turns, "
+                  "sharing its caches and runs",
+}
+
+
+def steps(page, n_simulations, rng):
+    # (widget, key, value) in the order a session applies them; 'button'
+    # clicks the first button of the page. The Preliminary page answers
+    # from the duration table unless 'Live Simulation' is set, which would
+    # leave n_simulations without effect.
+    daily_users = int(rng.choice(np.arange(1000, 10001, 500)))
+    b_mean = round(float(rng.uniform(15.5, 17.0)), 1)
+    certainty = float(rng.choice([90.0, 95.0, 99.0]))
+    if page.startswith('1_'):
+        return [('checkbox', 'prelim_live', True),
+                ('number_input', 'prelim_n_simulations', n_simulations),
+                ('number_input', 'prelim_sim_daily_users', daily_users),
+                ('number_input', 'prelim_b_mean', b_mean),
+                ('number_input', 'prelim_pb_gt_pa_required', certainty),
+                ('number_input', 'prelim_b_split', float(rng.choice([30.0, 40.0, 60.0]))),
+                ('number_input', 'prelim_sim_daily_users', 5000),
+                ('number_input', 'prelim_n_groups', 3),
+                ('number_input', 'prelim_n_groups', 2)]
+    return [('number_input', 'conv_n_simulations', n_simulations),
+            ('button', None, None),
+            ('number_input', 'conv_daily_users', daily_users),
+            ('number_input', 'conv_n_days', int(rng.integers(5, 30))),
+            ('number_input', 'conv_b_exact', b_mean),
+            ('button', None, None),
+            ('number_input', 'conv_pb_gt_pa_required', certainty),
+            ('number_input', 'conv_n_groups', 3)]
+
+
+def apply(at, widget, key, value):
+    if widget == 'button':
+        return at.button[0].click()
+    return getattr(at, widget)(key=key).set_value(value)
+
+
+def session(page, n_simulations, indices, barrier, results):
+    # drives one session per index, taking turns between them
+    from streamlit.testing.v1 import AppTest
+
+    import_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    apps = [AppTest.from_file(os.path.join(ROOT, page), default_timeout=TIMEOUT).run() for _ in indices]
+    errors = sum(len(at.exception) for at in apps)
+    barrier.wait()
+    latencies = []
+    for changes in zip(*(steps(page, n_simulations, np.random.default_rng(i)) for i in indices)):
+        for at, (widget, key, value) in zip(apps, changes):
+            start = time.perf_counter()
+            apply(at, widget, key, value).run()
+            latencies.append(time.perf_counter() - start)
+            errors += len(at.exception)
+    # ru_maxrss is in kilobytes on Linux
+    results.put({'latencies': latencies, 'errors': errors, 'finished': time.time(),
+                 'import_rss_mb': import_rss / 2**10,
+                 'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10})
+
+
+def run_level(page, sessions, n_simulations, mode='server'):
+    if mode == 'server':
+        return run_server_level(page, sessions, n_simulations)
+    ctx = multiprocessing.get_context('spawn')
+    indices = [list(range(sessions))] if mode == 'in_process' else [[i] for i in range(sessions)]
+    barrier = ctx.Barrier(len(indices) + 1)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=session, args=(page, n_simulations, i, barrier, results))
+                 for i in indices]
+    for p in processes:
+        p.start()
+    # all pages are loaded, the timed reruns start together
+    barrier.wait(timeout=TIMEOUT)
+    start = time.time()
+    done = [results.get(timeout=TIMEOUT) for _ in processes]
+    for p in processes:
+        p.join()
+    return level_result(page, mode, sessions, n_simulations,
+                        np.concatenate([d['latencies'] for d in done]),
+                        sum(d['errors'] for d in done),
+                        max(d['finished'] for d in done) - start,
+                        rss_mb=sum(d['rss_mb'] for d in done),
+                        session_rss_mb=max(d['rss_mb'] for d in done),
+                        import_rss_mb=max(d['import_rss_mb'] for d in done))
+
+
+def level_result(page, mode, sessions, n_simulations, latencies, errors, seconds, **rss):
+    return {
+        'page': page,
+        'mode': mode,
+        'sessions': sessions,
+        'n_simulations': n_simulations,
+        'reruns': int(latencies.size),
+        'errors': errors,
+        'seconds': seconds,
+        'throughput': latencies.size / seconds,
+        'latency': {f'p{q}': float(np.percentile(latencies, q)) for q in PERCENTILES},
+        **rss,
+    }
+
+
+class Client:
+    # One browser tab of a streamlit server: every rerun sends the widget
+    # values set so far, as the frontend does, and reads the page until
+    # the script finishes. Widgets are looked up by key in the last run,
+    # unkeyed ones (the buttons) by order.
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.page_hash = ''
+        self.values = {}
+        self.widgets = []
+        self.app_pages = []
+        self.errors = 0
+
+    def widget(self, kind, key=None):
+        return next(w for k, wkey, w in self.widgets if k == kind and (key is None or wkey == key))
+
+    async def rerun(self, trigger=None):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        msg = BackMsg()
+        msg.rerun_script.page_script_hash = self.page_hash
+        ids = {wkey: w.id for _, wkey, w in self.widgets}
+        for key, (field, value) in self.values.items():
+            if key in ids:
+                state = msg.rerun_script.widget_states.widgets.add(id=ids[key])
+                setattr(state, field, value)
+        if trigger is not None:
+            msg.rerun_script.widget_states.widgets.add(id=trigger, trigger_value=True)
+        await self.ws.send(msg.SerializeToString())
+        self.widgets = []
+        while True:
+            reply = ForwardMsg()
+            reply.ParseFromString(await asyncio.wait_for(self.ws.recv(), TIMEOUT))
+            kind = reply.WhichOneof('type')
+            if kind == 'navigation':
+                self.app_pages = list(reply.navigation.app_pages)
+            elif kind == 'script_finished':
+                return
+            elif kind == 'delta' and reply.delta.WhichOneof('type') == 'new_element':
+                element = reply.delta.new_element
+                element_type = element.WhichOneof('type')
+                self.errors += element_type == 'exception'
+                proto = getattr(element, element_type)
+                if getattr(proto, 'id', ''):
+                    # ids of keyed widgets end with the key
+                    self.widgets.append((element_type, proto.id.rsplit('-', 1)[-1], proto))
+
+    async def apply(self, widget, key, value):
+        from streamlit.proto.NumberInput_pb2 import NumberInput
+
+        if widget == 'button':
+            return await self.rerun(trigger=self.widget('button').id)
+        if widget == 'checkbox':
+            self.values[key] = ('bool_value', value)
+        elif self.widget(widget, key).data_type == NumberInput.INT:
+            self.values[key] = ('int_value', int(value))
+        else:
+            self.values[key] = ('double_value', float(value))
+        await self.rerun()
+
+
+async def open_session(url, page):
+    import websockets
+
+    client = Client(await websockets.connect(url, subprotocols=['streamlit'], max_size=None))
+    await client.rerun()
+    if page != PAGES[0]:
+        # the server runs the first page, the others are found by url
+        client.page_hash = next(p.page_script_hash for p in client.app_pages
+                                if p.url_pathname and p.url_pathname in page)
+        await client.rerun()
+    return client
+
+
+async def replay(client, page, n_simulations, index):
+    latencies = []
+    for widget, key, value in steps(page, n_simulations, np.random.default_rng(index)):
+        start = time.perf_counter()
+        await client.apply(widget, key, value)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def server_sessions(url, page, n_simulations, sessions):
+    # all pages are loaded, the timed reruns start together
+    clients = await asyncio.gather(*(open_session(url, page) for _ in range(sessions)))
+    try:
+        start = time.time()
+        latencies = await asyncio.gather(*(replay(c, page, n_simulations, i) for i, c in enumerate(clients)))
+        return np.concatenate(latencies), sum(c.errors for c in clients), time.time() - start
+    finally:
+        await asyncio.gather(*(c.ws.close() for c in clients))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port):
+    # a fresh server per level, so no level starts with the caches of another
+    server = subprocess.Popen([sys.executable, '-m', 'streamlit', 'run', PAGES[0],
+                               '--server.headless', 'true', '--server.port', str(port),
+                               '--browser.gatherUsageStats', 'false'],
+                              cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + SERVER_START_TIMEOUT
+    while True:
+        try:
+            urllib.request.urlopen(f'http://localhost:{port}/_stcore/health', timeout=1)
+            return server
+        except OSError:
+            if server.poll() is not None or time.time() > deadline:
+                server.kill()
+                raise RuntimeError("streamlit server did not start")
+            time.sleep(0.2)
+
+
+def memory_mb(pid, field):
+    # 'VmRSS', or 'VmHWM' for the peak, of a running process
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) / 2**10
+
+
+def run_server_level(page, sessions, n_simulations):
+    port = free_port()
+    server = start_server(port)
+    try:
+        idle_rss = memory_mb(server.pid, 'VmRSS')
+        latencies, errors, seconds = asyncio.run(
+            server_sessions(f'ws://localhost:{port}/_stcore/stream', page, n_simulations, sessions))
+        rss = memory_mb(server.pid, 'VmHWM')
+    finally:
+        server.terminate()
+        server.wait()
+    return level_result(page, 'server', sessions, n_simulations, latencies, errors, seconds,
+                        rss_mb=rss, session_rss_mb=(rss - idle_rss) / sessions, import_rss_mb=idle_rss)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default='loadtest.json')
+    parser.add_argument('--quick', action='store_true', help="small grid for smoke runs")
+    parser.add_argument('--sessions', type=int, nargs='+', help="concurrency levels")
+    parser.add_argument('--simulations', type=int, nargs='+', help="n_simulations levels")
+    parser.add_argument('--page', default='', help="only pages whose path contains this")
+    parser.add_argument('--mode', choices=list(MODES), default='server',
+                        help="server: concurrent clients of one streamlit server; "
+                             "processes, in_process: AppTest sessions, cost per session only")
+    args = parser.parse_args(argv)
+
+    concurrency = args.sessions or (QUICK_CONCURRENCY if args.quick else CONCURRENCY)
+    simulations = args.simulations or (QUICK_SIMULATIONS if args.quick else SIMULATIONS)
+
+    results = []
+    for page in PAGES:
+        if args.page not in page:
+            continue
+        for n_simulations in simulations:
+            for sessions in concurrency:
+                r = run_level(page, sessions, n_simulations, args.mode)
+                results.append(r)
+                latency = ' '.join(f"{k} {v:7.3f}" for k, v in r['latency'].items())
+                print(f"{page:36s} {sessions:3d} sessions {n_simulations:6d} sims  {latency} s "
+                      f"{r['throughput']:6.2f} reruns/s {r['rss_mb']:8.1f} MB {r['errors']} errors",
+                      flush=True)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'cpus': os.cpu_count(),
+        'mode': args.mode,
+        'measures': MODES[args.mode],
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
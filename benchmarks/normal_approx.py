@@ -0,0 +1,97 @@
+"""Error of the normal approximations against their error bounds.
+
+    python benchmarks/normal_approx.py --output normal_approx.json
+
+Draws random posterior pairs (conversions 0.001-60% log-uniform, 20 to
+2e6 trials, lifts around 10%) and compares the normal approximation of
+P(B>A) with quadrature, and the normal HPDI with bisection; HPDI errors
+and tolerances are relative to the interval width. For every tolerance
+it reports the share of evaluations on the normal path and the largest
+error among them; 'max_ratio' is the largest error / bound overall.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.special import ndtr
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from coinflip.compare import pb_gt_pa, pb_gt_pa_normal_error
+from coinflip.posterior import beta_hpdi, beta_hpdi_normal_error, beta_mean_std
+
+TOLS = [1e-3, 1e-4, 1e-5]
+HPDI_TOLS = [1e-2, 5e-3, 1e-3]
+HPDI = 0.95
+
+
+def posteriors(n, rng):
+    p = np.exp(rng.uniform(np.log(1e-5), np.log(0.6), n))
+    n_a = np.exp(rng.uniform(np.log(20), np.log(2e6), n))
+    n_b = n_a * np.exp(rng.normal(0, 0.5, n))
+    p_b = np.clip(p * np.exp(rng.normal(0, 0.1, n)), 1e-6, 0.99)
+    a_alpha = 1 + np.rint(p * n_a)
+    b_alpha = 1 + np.rint(p_b * n_b)
+    return a_alpha, 2 + np.rint(n_a) - a_alpha, b_alpha, 2 + np.rint(n_b) - b_alpha
+
+
+def report(name, error, bound, seconds, tols=TOLS):
+    print(f"{name:8s} max error / bound {np.max(error / bound):.3f}")
+    results = []
+    for tol in tols:
+        normal = bound <= tol
+        max_error = float(np.max(error[normal])) if normal.any() else None
+        results.append({'tol': tol, 'normal_share': float(np.mean(normal)), 'max_error': max_error})
+        print(f"{name:8s} tol {tol:.0e} normal share {np.mean(normal):6.1%} max error {max_error}")
+    return {'name': name, 'max_ratio': float(np.max(error / bound)), 'seconds': seconds, 'tols': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default='normal_approx.json')
+    parser.add_argument('--n', type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    a_alpha, a_beta, b_alpha, b_beta = posteriors(args.n, rng)
+
+    start = time.perf_counter()
+    exact = pb_gt_pa(a_alpha, a_beta, b_alpha, b_beta, method='quad')
+    quad_seconds = time.perf_counter() - start
+    a_mean, a_std = beta_mean_std(a_alpha, a_beta)
+    b_mean, b_std = beta_mean_std(b_alpha, b_beta)
+    start = time.perf_counter()
+    normal = ndtr((b_mean - a_mean) / np.sqrt(a_std**2 + b_std**2))
+    normal_seconds = time.perf_counter() - start
+    print(f"P(B>A) quad {quad_seconds:.3f} s, normal {normal_seconds:.4f} s for {args.n} pairs")
+    results = [report('P(B>A)', np.abs(normal - exact),
+                      pb_gt_pa_normal_error(a_alpha, a_beta, b_alpha, b_beta),
+                      {'exact': quad_seconds, 'normal': normal_seconds})]
+
+    alpha, beta = np.concatenate([a_alpha, b_alpha]), np.concatenate([a_beta, b_beta])
+    start = time.perf_counter()
+    lower, upper = beta_hpdi(HPDI, alpha, beta)
+    bisection_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    normal_lower, normal_upper = beta_hpdi(HPDI, alpha, beta, normal_tol=np.inf)
+    normal_seconds = time.perf_counter() - start
+    print(f"HPDI bisection {bisection_seconds:.3f} s, normal {normal_seconds:.4f} s for {alpha.size} posteriors")
+    error = np.maximum(np.abs(lower - normal_lower), np.abs(upper - normal_upper)) / (upper - lower)
+    results.append(report('HPDI', error, beta_hpdi_normal_error(HPDI, alpha, beta),
+                          {'exact': bisection_seconds, 'normal': normal_seconds}, HPDI_TOLS))
+
+    output = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'n': args.n,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""Benchmarks for the statistical kernels and both Streamlit pages.
+
+    python benchmarks/run.py --output bench.json [--quick] [--no-pages]
+    python benchmarks/compare.py old.json new.json
+
+Each case records the best wall time over --repeat runs and the peak
+traced memory of one extra run.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import scipy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from coinflip.cache import CACHE_ENV, clear_memory_caches
+from coinflip.compare import p_best, pb_gt_pa, posterior_summary
+from coinflip.posterior import beta_hpdi
+from coinflip.simulation import (pb_ge_pa_sims, run_arm_simulations, run_duration_simulations,
+                                 run_duration_sweep, simulate)
+
+DAYS = [10, 30, 90, 180, 365]
+SIMULATIONS = [100, 1000, 10000]
+N_CMP = [1000, 10000, 100000]
+ARMS = [2, 4, 8]
+QUICK_DAYS = [10, 30]
+QUICK_SIMULATIONS = [100, 1000]
+QUICK_N_CMP = [1000, 10000]
+QUICK_ARMS = [2, 4]
+# (page, checkboxes to set): the Preliminary page answers two groups
+# from the duration table unless 'Live Simulation' is set, so it runs
+# both ways
+PAGES = [('1_Preliminary_Duration_Estimates.py', {'prelim_live': True}),
+         ('1_Preliminary_Duration_Estimates.py', {'prelim_live': False}),
+         ('pages/2_Conversions.py', {})]
+RUN_BUTTON = 'Run Duration Simulation'
+
+DAILY_USERS = 3000
+P_A, P_B = 0.15, 0.16
+
+
+def observed(days):
+    # accumulated posteriors of an experiment with DAILY_USERS split 50/50
+    rng = np.random.default_rng(0)
+    trials = np.full(days, DAILY_USERS // 2)
+    s_a = simulate(P_A, trials, 1, 1, random_state=rng)
+    s_b = simulate(P_B, trials, 1, 1, random_state=rng)
+    return s_a, s_b
+
+
+def measure(func, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 2**20
+
+
+def observed_arms(days, arms):
+    # accumulated posteriors of DAILY_USERS split equally between arms,
+    # shaped (days, arms) as p_best expects
+    rng = np.random.default_rng(0)
+    trials = np.full((arms, days), DAILY_USERS // arms)
+    p = np.linspace(P_A, P_B, arms)
+    s = simulate(p, trials, 1, 1, random_state=rng)
+    return s['alpha_post'].T, s['beta_post'].T
+
+
+def kernel_cases(days_grid, sims_grid, n_cmp_grid, arms_grid):
+    for days in days_grid:
+        s_a, s_b = observed(days)
+        rng = np.random.default_rng(1)
+        trials = np.full(days, DAILY_USERS // 2)
+        for n_sim in sims_grid:
+            p = np.full(n_sim, P_A)
+            yield ('simulate', {'days': days, 'n_simulations': n_sim},
+                   lambda: simulate(p, trials, 1, 1, random_state=rng))
+        for n_cmp in n_cmp_grid:
+            yield ('pb_ge_pa_sims', {'days': days, 'n_cmp': n_cmp, 'method': 'mc'},
+                   lambda: pb_ge_pa_sims(s_a, s_b, n_cmp=n_cmp, method='mc', random_state=rng))
+        for n_cmp in n_cmp_grid:
+            yield ('pb_ge_pa_sims', {'days': days, 'n_cmp': n_cmp, 'method': 'adaptive'},
+                   lambda: pb_ge_pa_sims(s_a, s_b, n_cmp=n_cmp, method='adaptive',
+                                         random_state=rng, threshold=0.95))
+        yield ('pb_ge_pa_sims', {'days': days, 'method': 'quad'},
+               lambda: pb_ge_pa_sims(s_a, s_b))
+        # prob_pb_gt_pa on the Conversions page: one (day, A, B) row
+        for n_cmp in n_cmp_grid:
+            yield ('prob_pb_gt_pa', {'days': days, 'n_cmp': n_cmp, 'method': 'mc'},
+                   lambda: pb_gt_pa(s_a['alpha_post'][-1], s_a['beta_post'][-1],
+                                    s_b['alpha_post'][-1], s_b['beta_post'][-1],
+                                    method='mc', n_cmp=n_cmp, random_state=rng))
+        yield ('prob_pb_gt_pa', {'days': days, 'method': 'quad'},
+               lambda: pb_gt_pa(s_a['alpha_post'][-1], s_a['beta_post'][-1],
+                                s_b['alpha_post'][-1], s_b['beta_post'][-1]))
+        # widedf P(B>A) curve: every day at once
+        for method in ('quad', 'exact'):
+            yield ('widedf_curve', {'days': days, 'method': method},
+                   lambda: pb_ge_pa_sims(s_a, s_b, method=method))
+        yield ('hpdi', {'days': days, 'groups': 2},
+               lambda: beta_hpdi(0.95, np.concatenate([s_a['alpha_post'], s_b['alpha_post']]),
+                                 np.concatenate([s_a['beta_post'], s_b['beta_post']])))
+        for n_sim in sims_grid:
+            yield ('duration_simulations', {'days': days, 'n_simulations': n_sim},
+                   lambda: run_duration_simulations(151, 851, 161, 841, DAILY_USERS, 0.5,
+                                                    days, n_sim, seed=7, n_workers=None))
+        # 5 x 5 traffic sweep in one job against the same cells one by one
+        sweep_users, sweep_splits = np.linspace(1000, 5000, 5), np.linspace(0.3, 0.7, 5)
+        yield ('duration_sweep', {'days': days, 'cells': 25, 'n_simulations': sims_grid[0]},
+               lambda: run_duration_sweep(151, 851, 161, 841, sweep_users, sweep_splits, days,
+                                          sims_grid[0], seed=7, pb_gt_pa_required=0.95))
+        yield ('duration_sweep_cells', {'days': days, 'cells': 25, 'n_simulations': sims_grid[0]},
+               lambda: [run_duration_simulations(151, 851, 161, 841, users, split, days, sims_grid[0],
+                                                 seed=7, pb_gt_pa_required=0.95)
+                        for users in sweep_users for split in sweep_splits])
+        # cost of the shared-sample P(best) should grow linearly with arms
+        for arms in arms_grid:
+            alpha, beta = observed_arms(days, arms)
+            for n_cmp in n_cmp_grid:
+                yield ('p_best', {'days': days, 'arms': arms, 'n_cmp': n_cmp},
+                       lambda: p_best(alpha, beta, n_cmp=n_cmp, random_state=rng))
+            # final-day summary table of the Conversions page
+            yield ('posterior_summary', {'days': days, 'arms': arms},
+                   lambda: posterior_summary(alpha[-1], beta[-1], random_state=rng))
+            yield ('arm_simulations', {'days': days, 'arms': arms, 'n_simulations': sims_grid[0]},
+                   lambda: run_arm_simulations(np.full(arms, 151), np.full(arms, 851), DAILY_USERS,
+                                               np.full(arms, 1 / arms), days, sims_grid[0],
+                                               seed=7, n_cmp=n_cmp_grid[0], n_workers=None))
+
+
+def page_cases():
+    from streamlit.testing.v1 import AppTest
+    import streamlit as st
+
+    # every repeat simulates: no disk cache, memory caches cleared below
+    os.environ.pop(CACHE_ENV, None)
+
+    def run_page(page, checkboxes):
+        st.cache_data.clear()
+        clear_memory_caches()
+        at = AppTest.from_file(os.path.join(ROOT, page), default_timeout=3600)
+        for key, value in checkboxes.items():
+            at.session_state[key] = value
+        at.run()
+        # the Conversions page simulates only on its button
+        for button in at.button:
+            if button.label == RUN_BUTTON:
+                at = button.click().run()
+        if at.exception:
+            raise RuntimeError(f"{page}: {at.exception[0].value}")
+
+    for page, checkboxes in PAGES:
+        yield ('page', {'page': page, **checkboxes}, lambda: run_page(page, checkboxes))
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default='bench.json')
+    parser.add_argument('--quick', action='store_true', help="small grid for smoke runs")
+    parser.add_argument('--no-pages', action='store_true', help="skip end-to-end page runs")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--filter', default='', help="only cases whose name contains this")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        grids = (QUICK_DAYS, QUICK_SIMULATIONS, QUICK_N_CMP, QUICK_ARMS)
+    else:
+        grids = (DAYS, SIMULATIONS, N_CMP, ARMS)
+    cases = kernel_cases(*grids)
+    if not args.no_pages:
+        cases = itertools.chain(cases, page_cases())
+
+    results = []
+    for name, params, func in cases:
+        if args.filter not in name:
+            continue
+        seconds, peak_mb = measure(func, args.repeat)
+        results.append({'name': name, 'params': params, 'seconds': seconds, 'peak_mb': peak_mb})
+        print(f"{name:22s} {json.dumps(params):60s} {seconds:9.4f} s {peak_mb:9.1f} MB", flush=True)
+
+    report = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'cpus': os.cpu_count(),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Error against sample count of the Monte Carlo sampling strategies.
+
+    python benchmarks/sampling.py --output sampling.json [--quick]
+
+For every case and strategy the Monte Carlo estimate is repeated with
+--repeat seeds and compared with a deterministic reference (quadrature
+for P(B>A), a large pseudo-random sample for P(best) of several arms).
+'curve' is P(B>A) over the days of one experiment; its 'diff_rmse' is
+the error of day-over-day changes, which common random numbers reduce
+most.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from coinflip.compare import SAMPLING, p_best, pb_gt_pa
+from coinflip.simulation import simulate
+
+N_CMP = [256, 1024, 4096, 16384]
+QUICK_N_CMP = [256, 1024]
+REFERENCE_N_CMP = 2**22
+
+DAILY_USERS = 3000
+P_A, P_B = 0.15, 0.16
+
+
+def cases(days):
+    # (name, alpha, beta, reference); arms on the last axis
+    rng = np.random.default_rng(0)
+    trials = np.full(days, DAILY_USERS // 2)
+    s_a = simulate(P_A, trials, 1, 1, random_state=rng)
+    s_b = simulate(P_B, trials, 1, 1, random_state=rng)
+    curve = (np.stack([s_a['alpha_post'], s_b['alpha_post']], axis=-1),
+             np.stack([s_a['beta_post'], s_b['beta_post']], axis=-1))
+    close = (np.array([226.0, 241.0]), np.array([1276.0, 1261.0]))
+    arms = (np.array([226.0, 241.0, 235.0, 230.0]), np.array([1276.0, 1261.0, 1267.0, 1272.0]))
+    for name, (alpha, beta) in (('pb_gt_pa', close), ('curve', curve)):
+        pb = pb_gt_pa(alpha[..., 0], beta[..., 0], alpha[..., 1], beta[..., 1])
+        yield name, alpha, beta, np.stack([1 - pb, pb], axis=-1)
+    yield 'p_best', *arms, p_best(*arms, n_cmp=REFERENCE_N_CMP, random_state=1)
+
+
+def measure(alpha, beta, reference, n_cmp, sampling, repeat):
+    estimates = []
+    start = time.perf_counter()
+    for seed in range(repeat):
+        estimates.append(p_best(alpha, beta, n_cmp=n_cmp, sampling=sampling, random_state=seed))
+    seconds = (time.perf_counter() - start) / repeat
+    errors = np.array(estimates) - reference
+    result = {'rmse': float(np.sqrt(np.mean(errors**2))), 'seconds': seconds}
+    if alpha.ndim > 1:
+        result['diff_rmse'] = float(np.sqrt(np.mean(np.diff(errors, axis=1)**2)))
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default='sampling.json')
+    parser.add_argument('--quick', action='store_true', help="small grid for smoke runs")
+    parser.add_argument('--repeat', type=int, default=100)
+    parser.add_argument('--days', type=int, default=30)
+    args = parser.parse_args(argv)
+
+    results = []
+    for name, alpha, beta, reference in cases(args.days):
+        for n_cmp in (QUICK_N_CMP if args.quick else N_CMP):
+            for sampling in SAMPLING:
+                r = measure(alpha, beta, reference, n_cmp, sampling, args.repeat)
+                results.append({'name': name, 'n_cmp': n_cmp, 'sampling': sampling, **r})
+                diff = f"{r['diff_rmse']:9.5f}" if 'diff_rmse' in r else ' ' * 9
+                print(f"{name:10s} {n_cmp:7d} {sampling:11s} rmse {r['rmse']:9.5f} diff {diff} "
+                      f"{r['seconds']:8.4f} s", flush=True)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'numpy': np.__version__,
+        'repeat': args.repeat,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+import importlib
+
+# The package re-exports these names from their modules on first access,
+# so that importing the compute modules (compare, posterior, simulation)
+# does not load pandas, which only batch and store need.
+_EXPORTS = {
+    'batch': ['evaluate_experiment', 'evaluate_experiments'],
+    'cache': ['disk_cached'],
+    'compare': ['p_best', 'pb_gt_pa', 'posterior_summary'],
+    'posterior': ['alpha_beta_post', 'beta_dist_mean_std_to_alpha_beta', 'beta_hpdi', 'beta_post_dist'],
+    'simulation': ['duration_simulations', 'min_days_to_reach_certainty_level', 'min_days_to_reach_p_best',
+                   'pb_ge_pa_sims', 'run_arm_simulations', 'run_duration_simulations', 'run_duration_sweep',
+                   'simulate'],
+    'store': ['append_days', 'open_store', 'read_experiment', 'update_experiment'],
+}
+_MODULES = {name: module for module, names in _EXPORTS.items() for name in names}
+__all__ = sorted(_MODULES)
+
+
+def __getattr__(name):
+    if name not in _MODULES:
+        raise AttributeError(f"module 'coinflip' has no attribute '{name}'")
+    value = getattr(importlib.import_module(f'coinflip.{_MODULES[name]}'), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
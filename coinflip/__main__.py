@@ -0,0 +1,3 @@
+from coinflip.cli import main
+
+main()
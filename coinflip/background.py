@@ -0,0 +1,105 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+# Long simulations run on a process-wide pool instead of the script
+# thread, so a page can stop waiting for a result nobody will see.
+# The task reports progress by calling progress(fraction_done); the call
+# only stores the fraction and raises Cancelled once the run is cancelled,
+# so cancellation takes effect at the task's next progress report.
+# The waiting side reads the stored fraction at most once per
+# PROGRESS_INTERVAL seconds, whatever the rate of reports.
+#
+# shared_run keeps the runs in flight by key, so a rerun of a page with
+# unchanged inputs, or another session asking for the same result, waits
+# for the run already going instead of starting over. A shared run nobody
+# waits for any more is cancelled after RUN_LINGER seconds unless a
+# waiter attaches again by then.
+PROGRESS_INTERVAL = 0.1
+RUN_LINGER = 3.0
+RUN_WORKERS = os.cpu_count()
+
+_executor = ThreadPoolExecutor(max_workers=RUN_WORKERS, thread_name_prefix='coinflip-run')
+_runs = {}
+_runs_lock = threading.Lock()
+
+
+class Cancelled(Exception):
+    pass
+
+
+class BackgroundRun:
+    # task(progress) is submitted on creation
+
+    def __init__(self, task):
+        self.fraction_done = 0.0
+        # waiters attached by shared_run, guarded by _runs_lock
+        self.waiters = 0
+        self._cancel = threading.Event()
+        self.future = _executor.submit(task, self._report)
+
+    def _report(self, fraction_done):
+        if self._cancel.is_set():
+            raise Cancelled()
+        self.fraction_done = fraction_done
+
+    def cancel(self):
+        # a queued task never starts, a running one stops at its next report
+        self._cancel.set()
+        self.future.cancel()
+
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def done(self):
+        return self.future.done()
+
+    def wait(self, on_progress=None, interval=PROGRESS_INTERVAL):
+        # Returns the task result, calling on_progress(fraction_done) at
+        # most once per interval meanwhile. Any exception while waiting,
+        # including the ones Streamlit raises in the script thread on a
+        # rerun or a closed session, cancels the run before propagating.
+        try:
+            return self._poll(on_progress, interval)
+        except BaseException:
+            self.cancel()
+            raise
+
+    def _poll(self, on_progress, interval):
+        while True:
+            try:
+                return self.future.result(timeout=interval)
+            except TimeoutError:
+                if on_progress is not None:
+                    on_progress(self.fraction_done)
+
+
+def shared_run(key, task, on_progress=None, interval=PROGRESS_INTERVAL, linger=RUN_LINGER):
+    # Returns the result of the run in flight for key, started with
+    # task(progress) if there is none, calling on_progress as in
+    # BackgroundRun.wait. An exception while waiting only detaches this
+    # waiter, the run is cancelled once it stays without waiters for
+    # linger seconds.
+    with _runs_lock:
+        for k in [k for k, r in _runs.items() if r.done()]:
+            del _runs[k]
+        run = _runs.get(key)
+        if run is None or run.cancelled():
+            run = _runs[key] = BackgroundRun(task)
+        run.waiters += 1
+    try:
+        return run._poll(on_progress, interval)
+    finally:
+        with _runs_lock:
+            run.waiters -= 1
+            unwatched = run.waiters == 0 and not run.done()
+        if unwatched:
+            timer = threading.Timer(linger, _cancel_unwatched, (run,))
+            timer.daemon = True
+            timer.start()
+
+
+def _cancel_unwatched(run):
+    with _runs_lock:
+        if run.waiters == 0:
+            run.cancel()
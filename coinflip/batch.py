@@ -0,0 +1,102 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from coinflip.compare import pb_gt_pa
+from coinflip.posterior import alpha_beta_post, beta_dist_mean_std_to_alpha_beta
+from coinflip.simulation import run_duration_simulations
+
+# Each experiment is one row. Planned experiments give prior conversions
+# as fractions (a_mean, a_std, b_mean, b_std); running experiments give
+# observed counts (a_conv, a_users, b_conv, b_users) and get a uniform
+# prior as on the Conversions page. Missing settings use DEFAULTS.
+# A row that cannot be evaluated gets NaN results and its error message
+# in the 'error' column, the rest of the batch goes on.
+# P(best) uses the row's method too; p_best_se is the standard error of
+# the Monte Carlo methods and 0 for the others.
+PRIOR_COLUMNS = ['a_mean', 'a_std', 'b_mean', 'b_std']
+OBSERVED_COLUMNS = ['a_conv', 'a_users', 'b_conv', 'b_users']
+DEFAULTS = {
+    'daily_users': 5000,
+    'b_split': 0.5,
+    'max_days': 30,
+    'n_simulations': 100,
+    'pb_gt_pa_required': 0.95,
+    'seed': 7,
+    'stopping': 'last_day',
+    'method': 'quad',
+}
+RESULT_COLUMNS = ['p_best_a', 'p_best_b', 'p_best_se', 'days_median', 'days_p90', 'reached_share']
+
+
+def experiment_alpha_beta(experiment):
+    if all(pd.notna(experiment.get(c)) for c in OBSERVED_COLUMNS):
+        a_alpha, a_beta = alpha_beta_post(1, 1, experiment['a_conv'], experiment['a_users'])
+        b_alpha, b_beta = alpha_beta_post(1, 1, experiment['b_conv'], experiment['b_users'])
+    elif all(pd.notna(experiment.get(c)) for c in PRIOR_COLUMNS):
+        a_alpha, a_beta = beta_dist_mean_std_to_alpha_beta(experiment['a_mean'], experiment['a_std'])
+        b_alpha, b_beta = beta_dist_mean_std_to_alpha_beta(experiment['b_mean'], experiment['b_std'])
+    else:
+        raise ValueError(f"Experiment needs either {OBSERVED_COLUMNS} or {PRIOR_COLUMNS}")
+    return a_alpha, a_beta, b_alpha, b_beta
+
+
+def evaluate_experiment(experiment):
+    experiment = {**DEFAULTS, **{k: v for k, v in experiment.items() if pd.notna(v)}}
+    a_alpha, a_beta, b_alpha, b_beta = experiment_alpha_beta(experiment)
+    sims = run_duration_simulations(a_alpha, a_beta, b_alpha, b_beta,
+                                    int(experiment['daily_users']),
+                                    experiment['b_split'],
+                                    int(experiment['max_days']),
+                                    int(experiment['n_simulations']),
+                                    int(experiment['seed']),
+                                    pb_gt_pa_required=experiment['pb_gt_pa_required'],
+                                    stopping=experiment['stopping'],
+                                    method=experiment['method'],
+                                    trajectories=False)
+    days = sims['min_days_to_reach_certainty_lvl']
+    mc_stats = {}
+    pb = float(pb_gt_pa(a_alpha, a_beta, b_alpha, b_beta, method=experiment['method'],
+                        random_state=int(experiment['seed']),
+                        threshold=experiment['pb_gt_pa_required'], mc_stats=mc_stats))
+    return {
+        'p_best_a': 1 - pb,
+        'p_best_b': pb,
+        'p_best_se': float(mc_stats.get('se', 0)),
+        'days_median': np.median(days),
+        'days_p90': np.percentile(days, 90),
+        'reached_share': np.mean(sims['reached']),
+    }
+
+
+def _evaluate_experiment_or_error(experiment):
+    try:
+        return {**evaluate_experiment(experiment), 'error': None}
+    except Exception as e:
+        return {**dict.fromkeys(RESULT_COLUMNS, np.nan), 'error': f"{type(e).__name__}: {e}"}
+
+
+def evaluate_experiments(experiments, n_workers=None, chunksize=16):
+    # experiments: DataFrame with one row per experiment;
+    # n_workers=1 runs in the calling process
+    records = experiments.to_dict(orient='records')
+    if n_workers == 1:
+        results = list(map(_evaluate_experiment_or_error, records))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_evaluate_experiment_or_error, records, chunksize=chunksize))
+    return pd.concat([experiments.reset_index(drop=True), pd.DataFrame(results)], axis=1)
+
+
+def read_table(path):
+    if str(path).endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def write_table(df, path):
+    if str(path).endswith('.parquet'):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
@@ -0,0 +1,198 @@
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# On-disk cache of simulation results shared by sessions and server
+# processes. Entries are keyed by a hash of the function name, its
+# arguments and CACHE_VERSION (bump it when a cached function starts
+# returning different results) and are stored as pickles in one SQLite
+# file, whose file locks serialize writers from several processes.
+# Least recently used entries are evicted once the stored results
+# exceed max_mb. Optionally the last results are also kept in memory,
+# shared by all threads of the process, in front of the file.
+#
+# COINFLIP_CACHE=path turns the cache on for disk_cached functions,
+# COINFLIP_CACHE_MAX_MB caps its size (default MAX_MB).
+CACHE_ENV = 'COINFLIP_CACHE'
+CACHE_MAX_MB_ENV = 'COINFLIP_CACHE_MAX_MB'
+CACHE_VERSION = 2
+MAX_MB = 512
+# seconds to wait for another process holding the write lock
+LOCK_TIMEOUT = 60
+# arguments that do not change results
+IGNORED_ARGS = ('n_workers', 'executor', 'progress')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    func TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access);
+"""
+
+
+def open_cache(path):
+    con = sqlite3.connect(path, timeout=LOCK_TIMEOUT)
+    # has to be set before the first table is created to take effect
+    con.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    con.execute("PRAGMA journal_mode = WAL")
+    con.executescript(SCHEMA)
+    return con
+
+
+def _update_hash(h, x):
+    if isinstance(x, np.generic):
+        x = x.item()
+    if isinstance(x, np.ndarray):
+        h.update(f'ndarray{x.dtype.str}{x.shape}'.encode())
+        h.update(np.ascontiguousarray(x).tobytes())
+    elif isinstance(x, (list, tuple)):
+        h.update(f'{type(x).__name__}{len(x)}'.encode())
+        for item in x:
+            _update_hash(h, item)
+    elif isinstance(x, dict):
+        h.update(f'dict{len(x)}'.encode())
+        for k in sorted(x):
+            _update_hash(h, k)
+            _update_hash(h, x[k])
+    else:
+        h.update(f'{type(x).__name__}:{x!r}'.encode())
+
+
+def cache_key(func_name, arguments):
+    # arguments: dict of argument name to value
+    h = hashlib.sha256(f'{func_name}:{CACHE_VERSION}'.encode())
+    _update_hash(h, arguments)
+    return h.hexdigest()
+
+
+def cache_get(con, key):
+    # None on a miss; a hit marks the entry as recently used
+    row = con.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    with con:
+        con.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+    return pickle.loads(row[0])
+
+
+def cache_put(con, key, func_name, value, max_mb=MAX_MB):
+    # Returns the number of evicted entries. Results larger than the
+    # whole cache are not stored.
+    blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    max_bytes = max_mb * 2**20
+    if len(blob) > max_bytes:
+        return 0
+    with con:
+        # takes the write lock before reading sizes, so concurrent
+        # writers cannot both decide to keep the same entries
+        con.execute("BEGIN IMMEDIATE")
+        con.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                    (key, func_name, blob, len(blob), time.time()))
+        rows = con.execute("SELECT key, size FROM results ORDER BY last_access DESC").fetchall()
+        sizes = np.cumsum([size for _, size in rows])
+        evicted = [(k,) for (k, _), total in zip(rows, sizes) if total > max_bytes]
+        con.executemany("DELETE FROM results WHERE key = ?", evicted)
+    if evicted:
+        con.execute("PRAGMA incremental_vacuum").fetchall()
+    return len(evicted)
+
+
+class MemoryCache:
+    # thread-safe LRU of at most max_entries results
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+_memory_caches = {}
+_memory_caches_lock = threading.Lock()
+
+
+def clear_memory_caches():
+    with _memory_caches_lock:
+        for memory in _memory_caches.values():
+            with memory.lock:
+                memory.entries.clear()
+
+
+def _disk_get_or_compute(path, key, func_name, max_mb, compute):
+    # a cache that cannot be read or written falls back to computing
+    try:
+        con = open_cache(path)
+    except sqlite3.Error:
+        return compute()
+    try:
+        try:
+            value = cache_get(con, key)
+        except sqlite3.Error:
+            value = None
+        if value is None:
+            value = compute()
+            try:
+                cache_put(con, key, func_name, value, max_mb)
+            except sqlite3.Error:
+                pass
+        return value
+    finally:
+        con.close()
+
+
+def disk_cached(func, path=None, max_mb=None, memory_entries=0, ignore=IGNORED_ARGS):
+    # Without path or COINFLIP_CACHE only the memory cache is used, and
+    # func is returned unchanged if memory_entries is 0 too. Cached
+    # results are shared, callers must not modify them.
+    path = path or os.environ.get(CACHE_ENV)
+    if not path and not memory_entries:
+        return func
+    max_mb = max_mb or float(os.environ.get(CACHE_MAX_MB_ENV, MAX_MB))
+    signature = inspect.signature(func)
+    func_name = f'{func.__module__}.{func.__qualname__}'
+    # one memory cache per function for the process, shared by all its wrappers
+    with _memory_caches_lock:
+        memory = _memory_caches.setdefault(func_name, MemoryCache(memory_entries)) if memory_entries else None
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = cache_key(func_name, {k: v for k, v in bound.arguments.items() if k not in ignore})
+        value = memory.get(key) if memory is not None else None
+        if value is not None:
+            return value
+        if path:
+            value = _disk_get_or_compute(path, key, func_name, max_mb, lambda: func(*args, **kwargs))
+        else:
+            value = func(*args, **kwargs)
+        if memory is not None:
+            memory.put(key, value)
+        return value
+
+    return wrapper
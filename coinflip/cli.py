@@ -0,0 +1,22 @@
+import argparse
+
+from coinflip.batch import DEFAULTS, OBSERVED_COLUMNS, PRIOR_COLUMNS, evaluate_experiments, read_table, write_table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='coinflip',
+        description="Duration estimates and P(best) for a table of A/B experiments. "
+                    f"Rows give either prior conversions {PRIOR_COLUMNS} "
+                    f"or observed counts {OBSERVED_COLUMNS}; optional columns "
+                    f"{list(DEFAULTS)} default to {list(DEFAULTS.values())}. "
+                    "Conversions, splits and certainty are fractions.")
+    parser.add_argument('input', help="experiments, .csv or .parquet")
+    parser.add_argument('output', help="results, .csv or .parquet")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="worker processes (default: number of CPUs)")
+    args = parser.parse_args(argv)
+
+    experiments = read_table(args.input)
+    results = evaluate_experiments(experiments, n_workers=args.workers)
+    write_table(results, args.output)
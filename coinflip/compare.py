@@ -0,0 +1,391 @@
+import numpy as np
+from scipy.special import betainc, betaincinv, betaln, ndtr
+
+from coinflip.posterior import NORMAL_TOL, beta_cumulants, beta_mean_std, beta_pdf
+
+# P(p_B > p_A) for p_A ~ Beta(a_alpha, a_beta), p_B ~ Beta(b_alpha, b_beta).
+# All parameters broadcast against each other, so whole trajectories
+# (days,) or batches of them (n_simulations, days) go in one call.
+#
+# Methods:
+#   'exact' - closed-form finite sum; needs one of the four parameters
+#             to be an integer, cost grows with that parameter.
+#   'quad'  - Gauss-Legendre quadrature of pdf_narrow * cdf_wide over
+#             +-QUAD_WIDTH std of the narrower posterior. Absolute error
+#             is below QUAD_TOL for alpha, beta >= QUAD_MIN_PARAM. Pairs
+#             with a smaller parameter, whose densities are unbounded or
+#             not smooth at 0 or 1 (the error reaches 4e-6 for parameters
+#             in [1, 1.5] and 0.07 below 1), go to adaptive quadrature
+#             over the quantiles of the wider posterior once per distinct
+#             pair, see _pb_gt_pa_singular.
+#   'mc'    - Monte Carlo with n_cmp draws per posterior, std error
+#             sqrt(p (1 - p) / n_cmp). Draws are made in chunks of at most
+#             chunk_size values per posterior, optionally in float32;
+#             for a given seed the result does not depend on chunk_size.
+#   'adaptive' - Monte Carlo in rounds of ADAPTIVE_ROUND draws, stopping
+#             for each posterior pair once the ADAPTIVE_Z standard error
+#             interval is on one side of both threshold and 1 - threshold,
+#             or after n_cmp draws. See pb_gt_pa_adaptive.
+#   'auto'  - normal approximation Phi(mean(p_B - p_A) / std(p_B - p_A))
+#             where pb_gt_pa_normal_error is below normal_tol, 'quad'
+#             elsewhere; path_counts, a dict, is incremented with the
+#             number of 'normal' and 'quad' evaluations.
+# With mc_stats, a dict, 'mc' (sampling='random') and 'adaptive' set its
+# 'se' and 'n_samples' to the standard errors and the number of draws
+# of each estimate.
+#
+# Sampling for 'mc':
+#   'random'     - independent pseudo-random Beta draws for every posterior.
+#   'antithetic' - uniforms u and 1 - u in pairs, mapped through the Beta
+#                  inverse cdf.
+#   'qmc'        - scrambled Sobol points mapped through the Beta inverse
+#                  cdf; n_cmp a power of two keeps the points balanced.
+# 'antithetic' and 'qmc' use one set of uniforms for every posterior in a
+# call (common random numbers), so neighbouring days and simulations share
+# their sampling error. The inverse cdf costs ~50x a pseudo-random draw, so
+# they pay off when precision per sample matters more than time per sample
+# (see benchmarks/sampling.py).
+METHODS = ('exact', 'quad', 'mc', 'adaptive', 'auto')
+SAMPLING = ('random', 'antithetic', 'qmc')
+QUAD_NODES = 64
+QUAD_WIDTH = 16
+QUAD_TOL = 1e-6
+QUAD_MIN_PARAM = 2
+# max over z of |phi(z) He_k(z)| for the Hermite polynomials in the
+# Edgeworth terms of skewness (k=2), excess kurtosis (k=3) and
+# squared skewness (k=5); the bound is doubled for the neglected terms
+EDGEWORTH_WEIGHTS = (0.3989 / 6, 0.5506 / 24, 2.3071 / 72)
+EDGEWORTH_SAFETY = 2
+
+# max number of floats per intermediate array
+ELEMENTS_PER_BLOCK = 2**22
+MC_CHUNK_SIZE = 2**20
+ADAPTIVE_ROUND = 500
+ADAPTIVE_Z = 3
+
+
+def pb_gt_pa(a_alpha, a_beta, b_alpha, b_beta, method='quad', n_cmp=30000, random_state=None,
+             chunk_size=MC_CHUNK_SIZE, dtype=np.float64, threshold=None, sampling='random',
+             normal_tol=NORMAL_TOL, path_counts=None, mc_stats=None):
+    if method not in METHODS:
+        raise ValueError(f"Unknown method '{method}', expected one of {METHODS}")
+    if sampling not in SAMPLING:
+        raise ValueError(f"Unknown sampling '{sampling}', expected one of {SAMPLING}")
+    params = np.broadcast_arrays(*[np.asarray(x, dtype=float)
+                                   for x in (a_alpha, a_beta, b_alpha, b_beta)])
+    shape = params[0].shape
+    if method == 'adaptive':
+        if threshold is None:
+            raise ValueError("Method 'adaptive' requires a threshold")
+        if sampling != 'random':
+            # the stopping rule relies on the standard error of independent draws
+            raise ValueError("Method 'adaptive' supports only sampling='random'")
+        p, se, n = pb_gt_pa_adaptive(*params, threshold=threshold, max_samples=n_cmp,
+                                     random_state=random_state, dtype=dtype)
+        if mc_stats is not None:
+            mc_stats.update(se=se, n_samples=n)
+        return p
+    if method == 'mc':
+        p = _pb_ge_pa_mc(*params, n_cmp=n_cmp, random_state=random_state,
+                         chunk_size=chunk_size, dtype=dtype, sampling=sampling)
+        if mc_stats is not None and sampling == 'random':
+            mc_stats.update(se=mc_std_error(p, n_cmp), n_samples=np.full(shape, n_cmp))
+        return p
+    if method == 'auto':
+        return _pb_gt_pa_auto(*[x.ravel() for x in params], normal_tol=normal_tol,
+                              path_counts=path_counts).reshape(shape)
+    kernel = _pb_gt_pa_exact if method == 'exact' else _pb_gt_pa_quad
+    return kernel(*[x.ravel() for x in params]).reshape(shape)
+
+
+def pb_gt_pa_normal_error(a_alpha, a_beta, b_alpha, b_beta):
+    # Bound on |P(B > A) - normal approximation| from the Edgeworth
+    # expansion of p_B - p_A, each term at its maximum over z.
+    # Measured errors stay below 0.6 of it, see benchmarks/normal_approx.py.
+    _, a_var, a_k3, a_k4 = beta_cumulants(a_alpha, a_beta)
+    _, b_var, b_k3, b_k4 = beta_cumulants(b_alpha, b_beta)
+    var = a_var + b_var
+    skewness = (b_k3 - a_k3) / var**1.5
+    excess_kurtosis = (a_k4 + b_k4) / var**2
+    w_skewness, w_kurtosis, w_skewness2 = EDGEWORTH_WEIGHTS
+    return EDGEWORTH_SAFETY * (w_skewness * np.abs(skewness) + w_kurtosis * np.abs(excess_kurtosis)
+                               + w_skewness2 * skewness**2)
+
+
+def _pb_gt_pa_auto(a_alpha, a_beta, b_alpha, b_beta, normal_tol=NORMAL_TOL, path_counts=None):
+    normal = pb_gt_pa_normal_error(a_alpha, a_beta, b_alpha, b_beta) <= normal_tol
+    res = np.empty(len(a_alpha))
+    a_mean, a_std = beta_mean_std(a_alpha[normal], a_beta[normal])
+    b_mean, b_std = beta_mean_std(b_alpha[normal], b_beta[normal])
+    res[normal] = ndtr((b_mean - a_mean) / np.sqrt(a_std**2 + b_std**2))
+    res[~normal] = _pb_gt_pa_quad(a_alpha[~normal], a_beta[~normal], b_alpha[~normal], b_beta[~normal])
+    if path_counts is not None:
+        path_counts['normal'] = path_counts.get('normal', 0) + int(np.sum(normal))
+        path_counts['quad'] = path_counts.get('quad', 0) + int(np.sum(~normal))
+    return res
+
+
+def _pb_gt_pa_quad(a_alpha, a_beta, b_alpha, b_beta):
+    res = np.empty(len(a_alpha))
+    singular = np.minimum(np.minimum(a_alpha, a_beta), np.minimum(b_alpha, b_beta)) < QUAD_MIN_PARAM
+    if np.any(singular):
+        res[singular] = _pb_gt_pa_singular(a_alpha[singular], a_beta[singular],
+                                           b_alpha[singular], b_beta[singular])
+        res[~singular] = _pb_gt_pa_quad(a_alpha[~singular], a_beta[~singular],
+                                        b_alpha[~singular], b_beta[~singular])
+        return res
+    nodes, weights = np.polynomial.legendre.leggauss(QUAD_NODES)
+    step = max(1, ELEMENTS_PER_BLOCK // QUAD_NODES)
+    for start in range(0, len(a_alpha), step):
+        sl = slice(start, start + step)
+        aa, ab, ba, bb = a_alpha[sl], a_beta[sl], b_alpha[sl], b_beta[sl]
+        # integrate against the narrower density so that the other
+        # cdf is smooth on the integration window
+        a_narrow = beta_mean_std(aa, ab)[1] <= beta_mean_std(ba, bb)[1]
+        n_alpha, n_beta = np.where(a_narrow, aa, ba), np.where(a_narrow, ab, bb)
+        w_alpha, w_beta = np.where(a_narrow, ba, aa), np.where(a_narrow, bb, ab)
+        mean, std = beta_mean_std(n_alpha, n_beta)
+        lo = np.clip(mean - QUAD_WIDTH * std, 0, 1)[:, np.newaxis]
+        hi = np.clip(mean + QUAD_WIDTH * std, 0, 1)[:, np.newaxis]
+        x = lo + (hi - lo) * (nodes + 1) / 2
+        w = weights * (hi - lo) / 2
+        pdf = w * beta_pdf(x, n_alpha[:, np.newaxis], n_beta[:, np.newaxis])
+        cdf = betainc(w_alpha[:, np.newaxis], w_beta[:, np.newaxis], x)
+        # normalizing by the integrated pdf cancels most of the truncation error
+        p = np.sum(pdf * cdf, axis=1) / np.sum(pdf, axis=1)
+        res[sl] = np.where(a_narrow, 1 - p, p)
+    return res
+
+
+def _pb_gt_pa_singular(a_alpha, a_beta, b_alpha, b_beta):
+    # P(B > A) = int_0^1 F_A(ppf_B(u)) du by adaptive quadrature over the
+    # quantiles of the wider posterior (1 - P(A > B) when A is wider).
+    # The integrand is bounded by [0, 1] whatever the parameters, and the
+    # unbounded or non-smooth densities of parameters below QUAD_MIN_PARAM
+    # only leave algebraic endpoint singularities, which the extrapolation
+    # of QUADPACK handles. Such pairs are mostly priors, shared by every
+    # simulation, so each distinct pair is integrated once.
+    from scipy.integrate import quad
+    pairs, inverse = np.unique(np.stack([a_alpha, a_beta, b_alpha, b_beta], axis=1),
+                               axis=0, return_inverse=True)
+    res = np.empty(len(pairs))
+    for k, (aa, ab, ba, bb) in enumerate(pairs):
+        _, a_std = beta_mean_std(aa, ab)
+        _, b_std = beta_mean_std(ba, bb)
+        if b_std >= a_std:
+            res[k] = _quantile_integral(quad, aa, ab, ba, bb)
+        else:
+            res[k] = 1 - _quantile_integral(quad, ba, bb, aa, ab)
+    return np.clip(res[inverse.ravel()], 0, 1)
+
+
+def _quantile_integral(quad, aa, ab, ba, bb):
+    # int_0^1 F_A(ppf_B(u)) du. Quantiles above 1/2 are taken through the
+    # mirrored Beta(bb, ba) in terms of 1 - u and 1 - x, which keeps
+    # their distance to 1 below double precision resolution.
+    options = {'epsabs': QUAD_TOL / 20, 'epsrel': 0, 'limit': 200}
+    lower_mass = betainc(ba, bb, 0.5)
+    upper_mass = betainc(bb, ba, 0.5)
+    lower, _ = quad(lambda u: betainc(aa, ab, betaincinv(ba, bb, u)), 0, lower_mass, **options)
+    upper_sf, _ = quad(lambda v: betainc(ab, aa, betaincinv(bb, ba, v)), 0, upper_mass, **options)
+    return lower + upper_mass - upper_sf
+
+
+def _sum_pb_gt_pa(a_alpha, a_beta, b_alpha, b_beta):
+    # Evan Miller's formula, b_alpha has to be an integer
+    n_terms = np.rint(b_alpha).astype(int)
+    elem = np.repeat(np.arange(len(n_terms)), n_terms)
+    i = np.arange(len(elem)) - np.repeat(np.cumsum(n_terms) - n_terms, n_terms)
+    aa, ab, bb = a_alpha[elem], a_beta[elem], b_beta[elem]
+    terms = np.exp(betaln(aa + i, ab + bb) - np.log(bb + i)
+                   - betaln(1 + i, bb) - betaln(aa, ab))
+    return np.bincount(elem, weights=terms, minlength=len(n_terms))
+
+
+def _pb_gt_pa_exact(a_alpha, a_beta, b_alpha, b_beta):
+    # P(B > A) = S(A, B) = 1 - S(B, A); with q = 1 - p the roles of
+    # alpha and beta swap, so any integer parameter can be summed over
+    variants = [
+        (b_alpha, (a_alpha, a_beta, b_alpha, b_beta), False),
+        (a_alpha, (b_alpha, b_beta, a_alpha, a_beta), True),
+        (a_beta, (b_beta, b_alpha, a_beta, a_alpha), False),
+        (b_beta, (a_beta, a_alpha, b_beta, b_alpha), True),
+    ]
+    n_terms = np.array([np.where(np.isclose(v, np.rint(v), rtol=0, atol=1e-9) & (v >= 1), v, np.inf)
+                        for v, _, _ in variants])
+    if np.any(np.isinf(np.min(n_terms, axis=0))):
+        raise ValueError("Exact method requires an integer parameter >= 1 for each posterior pair, "
+                         "use method='quad' instead")
+    choice = np.argmin(n_terms, axis=0)
+    res = np.empty(len(a_alpha))
+    for k, (_, params, complement) in enumerate(variants):
+        idx = np.flatnonzero(choice == k)
+        # split so that the number of summed terms per block is bounded
+        bounds = np.searchsorted(np.cumsum(n_terms[k, idx]),
+                                 np.arange(ELEMENTS_PER_BLOCK, np.sum(n_terms[k, idx]), ELEMENTS_PER_BLOCK))
+        for part in np.split(idx, bounds):
+            p = _sum_pb_gt_pa(*[x[part] for x in params])
+            res[part] = 1 - p if complement else p
+    return np.clip(res, 0, 1)
+
+
+def _beta_draws(streams, alpha, beta, size, dtype):
+    if dtype == np.float64:
+        return streams[0].beta(alpha, beta, size=size)
+    x = streams[0].standard_gamma(alpha, size=size, dtype=dtype)
+    y = streams[1].standard_gamma(beta, size=size, dtype=dtype)
+    return x / (x + y)
+
+
+def _uniforms(sampling, n, dim, random_state):
+    # (n, dim) uniforms shared by all posteriors of a call
+    if sampling == 'qmc':
+        # scipy.stats is slow to import and only needed here
+        from scipy.stats import qmc
+        m = int(np.ceil(np.log2(max(n, 1))))
+        return qmc.Sobol(dim, scramble=True, seed=random_state).random_base2(m)[:n]
+    u = random_state.random(((n + 1) // 2, dim))
+    return np.concatenate([u, 1 - u])[:n]
+
+
+def _inverse_cdf_draws(u, alpha, beta):
+    # u: (samples,) uniforms, broadcast against the posterior shape
+    return betaincinv(alpha, beta, u.reshape(u.shape + (1,) * alpha.ndim))
+
+
+def _pb_ge_pa_mc(a_alpha, a_beta, b_alpha, b_beta, n_cmp, random_state=None,
+                 chunk_size=MC_CHUNK_SIZE, dtype=np.float64, sampling='random'):
+    # Only per-posterior counts of pb >= pa are kept between chunks.
+    # Each group draws from its own streams, and chunks split the sample
+    # axis, so the drawn sequence is the same for any chunk_size.
+    if not isinstance(random_state, np.random.Generator):
+        random_state = np.random.default_rng(random_state)
+    shape = a_alpha.shape
+    samples_per_chunk = max(1, chunk_size // max(1, a_alpha.size))
+    counts = np.zeros(shape, dtype=np.int64)
+    if sampling != 'random':
+        u = _uniforms(sampling, n_cmp, 2, random_state)
+        for start in range(0, n_cmp, samples_per_chunk):
+            chunk = u[start:start + samples_per_chunk]
+            pa = _inverse_cdf_draws(chunk[:, 0], a_alpha, a_beta)
+            pb = _inverse_cdf_draws(chunk[:, 1], b_alpha, b_beta)
+            counts += np.sum(pb >= pa, axis=0)
+        return counts / n_cmp
+    streams = random_state.spawn(4)
+    for start in range(0, n_cmp, samples_per_chunk):
+        size = (min(samples_per_chunk, n_cmp - start),) + shape
+        pa = _beta_draws(streams[:2], a_alpha, a_beta, size, dtype)
+        pb = _beta_draws(streams[2:], b_alpha, b_beta, size, dtype)
+        counts += np.sum(pb >= pa, axis=0)
+    return counts / n_cmp
+
+
+def pb_gt_pa_adaptive(a_alpha, a_beta, b_alpha, b_beta, threshold, max_samples=30000,
+                      round_size=ADAPTIVE_ROUND, z=ADAPTIVE_Z, random_state=None, dtype=np.float64):
+    # Returns estimates, their standard errors and the number of draws used.
+    # Draws stop for a pair once p +- z * se no longer straddles threshold
+    # or 1 - threshold, so the decision p > threshold or p < 1 - threshold
+    # is the one more samples would give with high probability.
+    params = np.broadcast_arrays(*[np.asarray(x, dtype=float)
+                                   for x in (a_alpha, a_beta, b_alpha, b_beta)])
+    shape = params[0].shape
+    params = [x.ravel() for x in params]
+    if not isinstance(random_state, np.random.Generator):
+        random_state = np.random.default_rng(random_state)
+    streams = random_state.spawn(4)
+    counts = np.zeros(len(params[0]), dtype=np.int64)
+    n = np.zeros(len(params[0]), dtype=np.int64)
+    active = np.arange(len(params[0]))
+    bounds = np.sort([threshold, 1 - threshold])
+    while active.size:
+        aa, ab, ba, bb = [x[active] for x in params]
+        size = (min(round_size, max_samples - n[active[0]]), len(active))
+        pa = _beta_draws(streams[:2], aa, ab, size, dtype)
+        pb = _beta_draws(streams[2:], ba, bb, size, dtype)
+        counts[active] += np.sum(pb >= pa, axis=0)
+        n[active] += size[0]
+        # shrunk estimate keeps the interval open when no or all draws hit
+        p = (counts[active] + 0.5) / (n[active] + 1)
+        half_width = z * np.sqrt(p * (1 - p) / n[active])
+        straddles = np.any((p - half_width < bounds[:, np.newaxis])
+                           & (p + half_width > bounds[:, np.newaxis]), axis=0)
+        active = active[straddles & (n[active] < max_samples)]
+    p = counts / n
+    return p.reshape(shape), mc_std_error(p, n).reshape(shape), n.reshape(shape)
+
+
+def mc_std_error(p, n):
+    # p (1 - p) is floored at 1 / (4 n), so that estimates of 0 or 1
+    # from n draws do not claim a zero error
+    return np.sqrt(np.maximum(p * (1 - p), 0.25 / n) / n)
+
+
+def p_best(alpha, beta, method='mc', n_cmp=30000, random_state=None, chunk_size=MC_CHUNK_SIZE,
+           sampling='random', path_counts=None):
+    # P(arm has the highest conversion) for Beta(alpha, beta) posteriors
+    # with arms on the last axis. 'mc' takes one shared draw per sample
+    # for all arms and counts the argmax, so cost is linear in arms;
+    # two arms can also use the deterministic pb_gt_pa methods.
+    # sampling as for pb_gt_pa, with one uniform dimension per arm.
+    alpha, beta = np.broadcast_arrays(np.asarray(alpha, dtype=float),
+                                      np.asarray(beta, dtype=float))
+    n_arms = alpha.shape[-1]
+    if method != 'mc':
+        if n_arms != 2 or method == 'adaptive':
+            raise ValueError(f"Method '{method}' is not available for P(best) of {n_arms} arms, use method='mc'")
+        pb = pb_gt_pa(alpha[..., 0], beta[..., 0], alpha[..., 1], beta[..., 1], method=method,
+                      path_counts=path_counts)
+        return np.stack([1 - pb, pb], axis=-1)
+    if sampling not in SAMPLING:
+        raise ValueError(f"Unknown sampling '{sampling}', expected one of {SAMPLING}")
+    if not isinstance(random_state, np.random.Generator):
+        random_state = np.random.default_rng(random_state)
+    samples_per_chunk = max(1, chunk_size // alpha.size)
+    counts = np.zeros(alpha.shape, dtype=np.int64)
+    if sampling != 'random':
+        u = _uniforms(sampling, n_cmp, n_arms, random_state)
+    for start in range(0, n_cmp, samples_per_chunk):
+        if sampling == 'random':
+            draws = random_state.beta(alpha, beta, size=(min(samples_per_chunk, n_cmp - start),) + alpha.shape)
+        else:
+            # arm k of every posterior uses uniform column k
+            chunk = u[start:start + samples_per_chunk]
+            draws = betaincinv(alpha, beta, chunk.reshape((len(chunk),) + (1,) * (alpha.ndim - 1) + (n_arms,)))
+        best = np.argmax(draws, axis=-1)
+        for arm in range(n_arms):
+            counts[..., arm] += np.sum(best == arm, axis=0)
+    return counts / n_cmp
+
+
+def posterior_summary(alpha, beta, n_sample=100000, hpdi=0.95, baseline=0, random_state=None):
+    # Everything reported about one set of posteriors, arms on the last
+    # axis of alpha and beta, from a single (n_sample, arms) draw, so the
+    # numbers agree with each other:
+    #   'mean', 'hpdi_lower', 'hpdi_upper' - per arm, the interval is the
+    #       shortest one holding hpdi of the sample
+    #   'p_best' - P(arm has the highest conversion)
+    #   'p_gt_baseline' - P(p_arm > p_baseline)
+    #   'rel', 'rel_mean' - sample and mean of p_arm / p_baseline
+    #   'expected_loss' - E[max(p) - p_arm], conversion lost by choosing arm
+    alpha, beta = np.broadcast_arrays(np.asarray(alpha, dtype=float),
+                                      np.asarray(beta, dtype=float))
+    rng = np.random.default_rng(random_state)
+    sample = rng.beta(alpha, beta, size=(n_sample,) + alpha.shape)
+    n_arms = alpha.shape[-1]
+    best = np.argmax(sample, axis=-1)
+    p_best = np.stack([np.mean(best == arm, axis=0) for arm in range(n_arms)], axis=-1)
+    rel = sample / sample[..., baseline:baseline + 1]
+    sorted_sample = np.sort(sample, axis=0)
+    k = int(np.ceil(hpdi * n_sample))
+    widths = sorted_sample[k - 1:] - sorted_sample[:n_sample - k + 1]
+    start = np.expand_dims(np.argmin(widths, axis=0), 0)
+    return {
+        'mean': np.mean(sample, axis=0),
+        'hpdi_lower': np.take_along_axis(sorted_sample, start, axis=0)[0],
+        'hpdi_upper': np.take_along_axis(sorted_sample, start + k - 1, axis=0)[0],
+        'p_best': p_best,
+        'p_gt_baseline': np.mean(rel > 1, axis=0),
+        'rel': rel,
+        'rel_mean': np.mean(rel, axis=0),
+        'expected_loss': np.mean(np.max(sample, axis=-1, keepdims=True) - sample, axis=0),
+    }
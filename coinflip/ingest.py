@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+# User-level event logs: one row per user with the assigned group,
+# the assignment day (day number or date/timestamp) and a 0/1 conversion.
+GROUP_COLUMN = 'group'
+DAY_COLUMN = 'day'
+CONV_COLUMN = 'converted'
+CHUNKSIZE = 1_000_000
+
+
+def read_user_log_chunks(source, columns, chunksize=CHUNKSIZE):
+    # source: path or file-like, .parquet or anything else read as csv
+    name = source if isinstance(source, str) else getattr(source, 'name', '')
+    if str(name).endswith('.parquet'):
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(source)
+        missing = set(columns) - set(parquet_file.schema_arrow.names)
+        if missing:
+            raise ValueError(f"Columns not found in event log: {sorted(missing)}")
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(source, usecols=columns, chunksize=chunksize)
+
+
+def aggregate_user_log(source, group_col=GROUP_COLUMN, day_col=DAY_COLUMN,
+                       conv_col=CONV_COLUMN, chunksize=CHUNKSIZE):
+    # Reduces the log chunk by chunk into the per-day table used on the
+    # Conversions page: group, day, n_users, conv. Memory is bounded by
+    # chunksize plus the groups x days result.
+    total = None
+    dates = False
+    for chunk in read_user_log_chunks(source, [group_col, day_col, conv_col], chunksize):
+        day = chunk[day_col]
+        if not is_numeric_dtype(day):
+            day = pd.to_datetime(day).dt.normalize()
+            dates = True
+        part = (chunk[conv_col].astype(int)
+                .groupby([chunk[group_col].astype(str), day], sort=False)
+                .agg(['size', 'sum']))
+        total = part if total is None else total.add(part, fill_value=0)
+    # a header-only csv still yields one empty chunk
+    if total is None or total.empty:
+        return pd.DataFrame({'group': [], 'day': [], 'n_users': [], 'conv': []})
+    total = total.astype(int)
+    total.index.names = ['group', 'day']
+    total = total.rename(columns={'size': 'n_users', 'sum': 'conv'}).reset_index()
+    if dates:
+        total['day'] = (total['day'] - total['day'].min()).dt.days
+    # days without users still get a row, so that groups share one day axis
+    full_index = pd.MultiIndex.from_product(
+        [np.sort(total['group'].unique()), np.arange(total['day'].min(), total['day'].max() + 1)],
+        names=['group', 'day'])
+    total = total.set_index(['group', 'day']).reindex(full_index, fill_value=0).reset_index()
+    return total
@@ -0,0 +1,240 @@
+import argparse
+import itertools
+import os
+import time
+
+import numpy as np
+
+from coinflip.posterior import beta_dist_mean_std_to_alpha_beta
+from coinflip.simulation import run_duration_simulations, run_duration_sweep
+
+# Precomputed days to reach certainty for planning questions. The table
+# holds quantiles of the simulated days over a regular grid of AXES,
+# A mean and B lift relative to it, the prior stds of A and B (fractions),
+# daily users, B traffic share and required certainty, for one max_days
+# with the stopping rule 'last_day'. log(1 + days) is interpolated
+# linearly in the grid coordinates, taken on a log scale for LOG_AXES,
+# which halves the largest errors of interpolating days. Points outside
+# the grid get None and are left to a live simulation.
+#
+# The build also simulates n_check random points inside the grid
+# independently and stores their interpolation errors, which include the
+# Monte Carlo noise of both sides.
+#
+# A quantile is only reported where the interpolated share of simulations
+# reaching certainty exceeds it by REACHED_MARGIN. Closer to it, part of
+# the simulations of the quantile never reach certainty within max_days,
+# and interpolating between cells that reach it and cells that do not
+# was off by up to 25 days for the shipped table, against 2.3 days at the
+# 95th percentile for the reported quantiles.
+#
+# The page reads TABLE_PATH, built with python -m coinflip.lookup, or
+# the table at COINFLIP_DURATION_TABLE=path.
+TABLE_ENV = 'COINFLIP_DURATION_TABLE'
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'duration_table.npz')
+AXES = ('a_mean', 'lift', 'a_std', 'b_std', 'daily_users', 'b_split', 'certainty')
+LOG_AXES = ('lift', 'a_std', 'b_std', 'daily_users')
+GRID = {
+    'a_mean': (0.02, 0.05, 0.1, 0.2, 0.4),
+    'lift': (0.02, 0.05, 0.1, 0.2),
+    'a_std': (0.001, 0.003, 0.01),
+    'b_std': (0.001, 0.003, 0.01),
+    'daily_users': (500, 1000, 2000, 5000, 10000, 20000),
+    'b_split': (0.3, 0.5, 0.7),
+    'certainty': (0.9, 0.95, 0.99),
+}
+QUICK_GRID = {
+    'a_mean': (0.1, 0.2),
+    'lift': (0.05, 0.1),
+    'a_std': (0.001, 0.01),
+    'b_std': (0.001, 0.01),
+    'daily_users': (1000, 5000),
+    'b_split': (0.3, 0.5),
+    'certainty': (0.9, 0.95),
+}
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+REACHED_MARGIN = 0.1
+MAX_DAYS = 30
+N_SIMULATIONS = 1000
+N_CHECK = 100
+SEED = 0
+
+
+def prior_alpha_beta(a_mean, lift, a_std, b_std):
+    (a_alpha, b_alpha), (a_beta, b_beta) = beta_dist_mean_std_to_alpha_beta(
+        np.array([a_mean, a_mean * (1 + lift)]), np.array([a_std, b_std]))
+    return a_alpha, a_beta, b_alpha, b_beta
+
+
+def simulate_durations(a_mean, lift, a_std, b_std, daily_users, b_split, certainty,
+                       max_days=MAX_DAYS, n_simulations=N_SIMULATIONS, seed=SEED, n_workers=None):
+    # quantiles of the days and reached share of one point, simulated
+    sims = run_duration_simulations(*prior_alpha_beta(a_mean, lift, a_std, b_std),
+                                    daily_users, b_split, max_days, n_simulations, seed,
+                                    method='auto', n_workers=n_workers, pb_gt_pa_required=certainty,
+                                    stopping='last_day', trajectories=False)
+    return (np.quantile(sims['min_days_to_reach_certainty_lvl'], QUANTILES),
+            np.mean(sims['reached']))
+
+
+def build_table(grid=GRID, max_days=MAX_DAYS, n_simulations=N_SIMULATIONS, n_check=N_CHECK,
+                seed=SEED, n_workers=None, progress=None):
+    # Every prior and certainty is one traffic sweep over daily users and
+    # B split with common random numbers, so neighbouring cells differ by
+    # traffic rather than noise. progress(fraction_done) is called after
+    # each sweep and each check point, see measure_error.
+    shape = tuple(len(grid[axis]) for axis in AXES)
+    days = np.empty(shape + (len(QUANTILES),), dtype=np.float32)
+    reached_share = np.empty(shape, dtype=np.float32)
+    priors = list(itertools.product(*(enumerate(grid[axis]) for axis in AXES[:4])))
+    n_steps = len(priors) * len(grid['certainty']) + n_check
+    step = 0
+    for prior in priors:
+        idx = tuple(i for i, _ in prior)
+        alpha_beta = prior_alpha_beta(*(x for _, x in prior))
+        for k, certainty in enumerate(grid['certainty']):
+            sweep = run_duration_sweep(*alpha_beta, grid['daily_users'], grid['b_split'], max_days,
+                                       n_simulations, seed, certainty, method='auto',
+                                       n_workers=n_workers)
+            days[idx + (..., k, slice(None))] = np.moveaxis(
+                np.quantile(sweep['min_days'], QUANTILES, axis=-1), 0, -1)
+            reached_share[idx + (..., k)] = np.mean(sweep['reached'], axis=-1)
+            step += 1
+            if progress is not None:
+                progress(step / n_steps)
+    table = {axis: np.asarray(grid[axis], dtype=float) for axis in AXES}
+    table.update({
+        'quantiles': np.asarray(QUANTILES),
+        'days': days,
+        'reached_share': reached_share,
+        'max_days': max_days,
+        'n_simulations': n_simulations,
+    })
+
+    def check_progress(fraction_done):
+        if progress is not None:
+            progress((step + fraction_done * n_check) / n_steps)
+
+    table['check_points'], table['check_errors'] = measure_error(table, n_check, seed, n_workers,
+                                                                 check_progress)
+    return table
+
+
+def measure_error(table, n_check=N_CHECK, seed=SEED, n_workers=None, progress=None):
+    # Simulates n_check random points of the table with their own seeds and
+    # returns the points and the absolute errors of the interpolated days.
+    rng = np.random.default_rng(seed)
+    check_points = np.empty((n_check, len(AXES)))
+    check_errors = np.empty((n_check, len(table['quantiles'])))
+    for i in range(n_check):
+        point = _random_point(table, rng)
+        simulated, _ = simulate_durations(*point, max_days=int(table['max_days']),
+                                          n_simulations=int(table['n_simulations']),
+                                          seed=seed + 1 + i, n_workers=n_workers)
+        check_points[i] = point
+        check_errors[i] = np.abs(interpolate_durations(table, *point)['days'] - simulated)
+        if progress is not None:
+            progress((i + 1) / n_check)
+    return check_points, check_errors
+
+
+def _coordinates(axis, x):
+    return np.log(x) if axis in LOG_AXES else np.asarray(x, dtype=float)
+
+
+def _random_point(table, rng):
+    # uniform in the grid coordinates, daily users rounded as on the page
+    point = []
+    for axis in AXES:
+        low, high = _coordinates(axis, table[axis][[0, -1]])
+        x = rng.uniform(low, high)
+        x = np.exp(x) if axis in LOG_AXES else x
+        point.append(float(np.rint(x)) if axis == 'daily_users' else float(x))
+    return point
+
+
+def table_path():
+    # None without a table
+    path = os.environ.get(TABLE_ENV, TABLE_PATH)
+    return path if os.path.exists(path) else None
+
+
+def save_table(path, table):
+    np.savez_compressed(path, **table)
+
+
+def load_table(path):
+    with np.load(path) as f:
+        return {k: f[k] for k in f.files}
+
+
+def interpolate_durations(table, a_mean, lift, a_std, b_std, daily_users, b_split, certainty,
+                          max_days=None):
+    # Returns 'days' (one per table['quantiles']), 'median_days',
+    # 'reached_share' and 'reported', True for the quantiles to report
+    # (see REACHED_MARGIN), or None outside the table or for another
+    # max_days.
+    if max_days is not None and max_days != table['max_days']:
+        return None
+    point = dict(zip(AXES, (a_mean, lift, a_std, b_std, daily_users, b_split, certainty)))
+    if any(not table[axis][0] <= point[axis] <= table[axis][-1] for axis in AXES):
+        return None
+    days, reached_share = _interpolate(table, [[point[axis] for axis in AXES]])
+    return {'days': days[0], 'median_days': np.interp(0.5, table['quantiles'], days[0]),
+            'reached_share': reached_share[0],
+            'reported': reported_quantiles(table, reached_share[0])}
+
+
+def _interpolate(table, points):
+    # days (n_points, quantiles) and reached shares (n_points,) of points
+    # (n_points, AXES) inside the table
+    from scipy.interpolate import RegularGridInterpolator
+    coordinates = [_coordinates(axis, table[axis]) for axis in AXES]
+    x = np.stack([_coordinates(axis, np.asarray(points, dtype=float)[:, i]) for i, axis in enumerate(AXES)],
+                 axis=-1)
+    days = np.expm1(RegularGridInterpolator(coordinates, np.log1p(table['days']))(x))
+    return days, RegularGridInterpolator(coordinates, table['reached_share'])(x)
+
+
+def reported_quantiles(table, reached_share):
+    return table['quantiles'] <= np.asarray(reached_share)[..., np.newaxis] - REACHED_MARGIN
+
+
+def check_error(table, quantile=0.5):
+    # measured absolute interpolation errors in days of one quantile, at
+    # the check points where it is reported
+    k = int(np.argmin(np.abs(table['quantiles'] - quantile)))
+    _, reached_share = _interpolate(table, table['check_points'])
+    return table['check_errors'][reported_quantiles(table, reached_share)[:, k], k]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m coinflip.lookup',
+        description="Precompute quantiles of the days to reach certainty over a grid of "
+                    f"{list(AXES)} for the Preliminary Duration Estimates page.")
+    parser.add_argument('output', nargs='?', default=TABLE_PATH, help=f"table, .npz (default {TABLE_PATH})")
+    parser.add_argument('--quick', action='store_true', help="small grid for smoke runs")
+    parser.add_argument('--max-days', type=int, default=MAX_DAYS)
+    parser.add_argument('--simulations', type=int, default=N_SIMULATIONS)
+    parser.add_argument('--check', type=int, default=N_CHECK,
+                        help="random points simulated to measure the interpolation error")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="worker threads (default: number of CPUs)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    table = build_table(QUICK_GRID if args.quick else GRID, max_days=args.max_days,
+                        n_simulations=args.simulations, n_check=args.check, n_workers=args.workers,
+                        progress=lambda fraction_done: print(f"{fraction_done:6.1%} "
+                                                             f"{time.perf_counter() - start:8.0f} s",
+                                                             flush=True))
+    save_table(args.output, table)
+    if args.check:
+        error = check_error(table)
+        print(f"median days error: p50 {np.median(error):.2f}, p95 {np.quantile(error, 0.95):.2f}, "
+              f"max {np.max(error):.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+import numpy as np
+
+# points per density curve and the window around the mean, in std
+DENSITY_POINTS = 200
+DENSITY_WIDTH = 8
+HISTOGRAM_BINS = 100
+
+
+def density_grid(mean, std, n_points=DENSITY_POINTS, width=DENSITY_WIDTH):
+    # Evaluation points for a density plot: n_points spread over
+    # mean +- width * std, where the mass is, plus the ends of [0, 1]
+    # so the flat tails are still drawn.
+    lower = max(mean - width * std, 0)
+    upper = min(mean + width * std, 1)
+    return np.unique(np.concatenate([[0], np.linspace(lower, upper, n_points), [1]]))
+
+
+def histogram(sample, bins=HISTOGRAM_BINS):
+    # pre-binned probability density histogram, returns bin centers,
+    # densities and bin widths ready for go.Bar
+    density, edges = np.histogram(sample, bins=bins, density=True)
+    return (edges[:-1] + edges[1:]) / 2, density, np.diff(edges)
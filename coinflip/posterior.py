@@ -0,0 +1,110 @@
+import numpy as np
+from scipy.special import betaincinv, betaln, ndtri, xlog1py, xlogy
+
+# scipy.stats takes about a second to import, so the Beta density and
+# moments are computed from scipy.special and it is only loaded by
+# beta_post_dist
+
+HPDI_ITERATIONS = 40
+# Posteriors of large experiments are close to normal. With normal_tol,
+# the normal approximation is used wherever its error bound is below
+# normal_tol, the exact computation elsewhere; NORMAL_TOL is the default
+# for callers opting in. See benchmarks/normal_approx.py for measured errors.
+NORMAL_TOL = 1e-4
+# The HPDI bound is relative to the interval width, so that rare
+# conversions with narrow, skewed posteriors are held to the same accuracy.
+HPDI_NORMAL_TOL = 5e-3
+
+
+def beta_logpdf(x, alpha, beta):
+    return xlogy(alpha - 1, x) + xlog1py(beta - 1, -x) - betaln(alpha, beta)
+
+
+def beta_pdf(x, alpha, beta):
+    return np.exp(beta_logpdf(x, alpha, beta))
+
+
+def beta_mean_std(alpha, beta):
+    mean = alpha / (alpha + beta)
+    std = np.sqrt(alpha * beta / ((alpha + beta)**2 * (alpha + beta + 1)))
+    return mean, std
+
+
+def beta_cumulants(alpha, beta):
+    # mean, variance, third and fourth cumulants
+    n = alpha + beta
+    mean, std = beta_mean_std(alpha, beta)
+    skewness = 2 * (beta - alpha) * np.sqrt(n + 1) / ((n + 2) * np.sqrt(alpha * beta))
+    excess_kurtosis = (6 * ((alpha - beta)**2 * (n + 1) - alpha * beta * (n + 2))
+                       / (alpha * beta * (n + 2) * (n + 3)))
+    return mean, std**2, skewness * std**3, excess_kurtosis * std**4
+
+
+def beta_hpdi_normal_error(hpdi, alpha, beta):
+    # Bound on the error of mean -+ z std as HPDI ends relative to the
+    # width 2 z std: half of |skewness| + |excess kurtosis| over 2 z.
+    # Empirical, the measured error stays below 0.7 of it for conversions
+    # from 1e-5 to 60% and 20 to 2e6 trials.
+    _, var, k3, k4 = beta_cumulants(alpha, beta)
+    return (np.abs(k3) / var**1.5 + np.abs(k4) / var**2) / (4 * ndtri((1 + hpdi) / 2))
+
+
+def beta_hpdi(hpdi, alpha, beta, normal_tol=None, path_counts=None):
+    # Highest posterior density interval of Beta(alpha, beta), vectorized
+    # over alpha and beta. With normal_tol (see HPDI_NORMAL_TOL),
+    # posteriors with beta_hpdi_normal_error below it get mean -+ z std
+    # clipped to [0, 1]; path_counts, a dict, is then incremented with the
+    # number of 'normal' and 'bisection' intervals.
+    alpha, beta = np.broadcast_arrays(np.asarray(alpha, dtype=float),
+                                      np.asarray(beta, dtype=float))
+    if normal_tol is None:
+        return _beta_hpdi_bisection(hpdi, alpha, beta)
+    normal = beta_hpdi_normal_error(hpdi, alpha, beta) <= normal_tol
+    lower, upper = np.empty(alpha.shape), np.empty(alpha.shape)
+    mean, std = beta_mean_std(alpha[normal], beta[normal])
+    half_width = ndtri((1 + hpdi) / 2) * std
+    lower[normal] = np.maximum(mean - half_width, 0)
+    upper[normal] = np.minimum(mean + half_width, 1)
+    lower[~normal], upper[~normal] = _beta_hpdi_bisection(hpdi, alpha[~normal], beta[~normal])
+    if path_counts is not None:
+        path_counts['normal'] = path_counts.get('normal', 0) + int(np.sum(normal))
+        path_counts['bisection'] = path_counts.get('bisection', 0) + int(np.sum(~normal))
+    return lower, upper
+
+
+def _beta_hpdi_bisection(hpdi, alpha, beta):
+    # The interval is [ppf(t), ppf(t + hpdi)] with t found by bisection
+    # on equal density at both ends; for a density monotone on [0, 1]
+    # this converges to the interval touching 0 or 1.
+    t_lo = np.zeros(alpha.shape)
+    t_hi = np.full(alpha.shape, 1 - hpdi)
+    for _ in range(HPDI_ITERATIONS):
+        t = (t_lo + t_hi) / 2
+        left = betaincinv(alpha, beta, t)
+        right = betaincinv(alpha, beta, t + hpdi)
+        # density at the left end still lower: move interval right
+        move_right = beta_logpdf(left, alpha, beta) < beta_logpdf(right, alpha, beta)
+        t_lo = np.where(move_right, t, t_lo)
+        t_hi = np.where(move_right, t_hi, t)
+    t = (t_lo + t_hi) / 2
+    return betaincinv(alpha, beta, t), betaincinv(alpha, beta, t + hpdi)
+
+
+def beta_dist_mean_std_to_alpha_beta(mean, std):
+    var = std**2
+    nu = mean * (1 - mean) / var - 1
+    alpha = mean * nu
+    beta = (1 - mean) * nu
+    return alpha, beta
+
+
+def alpha_beta_post(alpha, beta, n_conv, n_total):
+    alpha_post = alpha + n_conv
+    beta_post = beta + (n_total - n_conv)
+    return alpha_post, beta_post
+
+
+def beta_post_dist(alpha, beta, n_conv, n_total):
+    import scipy.stats as stats
+    alpha_post, beta_post = alpha_beta_post(alpha, beta, n_conv, n_total)
+    return stats.beta(a=alpha_post, b=beta_post)
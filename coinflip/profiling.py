@@ -0,0 +1,111 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+from contextlib import contextmanager
+
+# COINFLIP_PROFILE=1 turns the diagnostics on by default,
+# COINFLIP_PROFILE_LOG=path appends one JSON line per page run to path
+PROFILE_ENV = 'COINFLIP_PROFILE'
+PROFILE_LOG_ENV = 'COINFLIP_PROFILE_LOG'
+
+# tracemalloc is process wide: enabled profilers of all sessions share
+# one tracing, started by the first and stopped when the last one is
+# finished or garbage collected (a rerun interrupts a page before finish)
+_tracing_users = 0
+_tracing_started = False
+_tracing_lock = threading.Lock()
+
+
+def profiling_enabled():
+    return os.environ.get(PROFILE_ENV, '').lower() not in ('', '0', 'false', 'no')
+
+
+def _acquire_tracing():
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_started = True
+        _tracing_users += 1
+
+
+def _release_tracing():
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        _tracing_users -= 1
+        # tracing started outside of profilers is left running
+        if _tracing_users == 0 and _tracing_started:
+            tracemalloc.stop()
+            _tracing_started = False
+
+
+class Profiler:
+    # Wall time, call count and peak traced memory per named stage.
+    # Stages are flat: a stage inside another one resets its memory peak.
+    # Memory tracing is process wide, concurrent sessions add to the peaks.
+    # A disabled profiler only costs an empty context manager per stage.
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stages = {}
+        self.paths = {}
+        self.start = time.perf_counter()
+        self._release = None
+        if enabled:
+            _acquire_tracing()
+            self._release = weakref.finalize(self, _release_tracing)
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        tracemalloc.reset_peak()
+        mem_start = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak_mb = (tracemalloc.get_traced_memory()[1] - mem_start) / 2**20
+            s = self.stages.setdefault(name, {'stage': name, 'seconds': 0.0, 'calls': 0, 'peak_mb': 0.0})
+            s['seconds'] += seconds
+            s['calls'] += 1
+            s['peak_mb'] = max(s['peak_mb'], peak_mb)
+
+    def count_paths(self, name, path_counts):
+        # evaluations per computation path, e.g. {'normal': n, 'quad': m}
+        # from method='auto', summed per name
+        if not self.enabled or not path_counts:
+            return
+        counts = self.paths.setdefault(name, {})
+        for path, n in path_counts.items():
+            counts[path] = counts.get(path, 0) + n
+
+    def path_shares(self):
+        # one 'name: path share%, ...' line per counted name
+        return [f"{name}: " + ", ".join(f"{path} {n / sum(counts.values()) * 100:.0f}%"
+                                        for path, n in counts.items())
+                for name, counts in self.paths.items()]
+
+    def finish(self, page, log_path=None):
+        # releases memory tracing and returns the run record; with log_path
+        # (default: COINFLIP_PROFILE_LOG) the record is appended as a JSON line
+        if self._release is not None:
+            self._release()
+        record = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'page': page,
+            'pid': os.getpid(),
+            'total_seconds': time.perf_counter() - self.start,
+            'stages': list(self.stages.values()),
+            'paths': self.paths,
+        }
+        log_path = log_path or os.environ.get(PROFILE_LOG_ENV)
+        if log_path:
+            with open(log_path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        return record
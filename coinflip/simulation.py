@@ -0,0 +1,388 @@
+import functools
+import itertools
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from coinflip.compare import ELEMENTS_PER_BLOCK, MC_CHUNK_SIZE, QUAD_NODES, p_best, pb_gt_pa
+
+# simulations per independent random stream
+SIMULATIONS_PER_STREAM = 250
+# per-simulation trajectories of each group, dropped with trajectories=False
+TRAJECTORY_KEYS = ('trials_conv_accum', 'alpha_post', 'beta_post')
+# 'last_day': certainty has to hold on the last day, the result is the
+# first day it was reached; 'sequential': stop at the first day it is reached
+STOPPING_RULES = ('last_day', 'sequential')
+
+
+def simulate(p, trials, alpha, beta, random_state=None):
+    # p: scalar or array of conversions, one per simulation;
+    # results have shape p.shape + trials.shape[-1:]. For several arms
+    # p is (n_simulations, arms), trials (arms, days), alpha and beta (arms, 1)
+    p = np.asarray(p)
+    rng = np.random.default_rng(random_state)
+    trials_conv = rng.binomial(n=trials, p=p[..., np.newaxis], size=p.shape + np.shape(trials)[-1:])
+    trials_accum = np.cumsum(trials, axis=-1)
+    trials_conv_accum = np.cumsum(trials_conv, axis=-1)
+    alpha_post = trials_conv_accum + alpha
+    beta_post = (trials_accum - trials_conv_accum) + beta
+    s = {
+        'p': p,
+        'trials_accum': trials_accum,
+        'trials_conv_accum': trials_conv_accum,
+        'alpha_post': alpha_post,
+        'beta_post': beta_post
+    }
+    return s
+
+
+def pb_ge_pa_sims(s_a, s_b, n_cmp=30000, method='quad', random_state=None,
+                  chunk_size=MC_CHUNK_SIZE, dtype=np.float64, threshold=None, sampling='random',
+                  path_counts=None):
+    # posteriors can be (days,) or (n_simulations, days);
+    # chunk_size bounds the draws held in memory for method='mc',
+    # method='adaptive' needs the required certainty as threshold;
+    # with sampling other than 'random' all days and simulations share
+    # one set of uniforms
+    return pb_gt_pa(s_a['alpha_post'], s_a['beta_post'],
+                    s_b['alpha_post'], s_b['beta_post'],
+                    method=method, n_cmp=n_cmp, random_state=random_state,
+                    chunk_size=chunk_size, dtype=dtype, threshold=threshold, sampling=sampling,
+                    path_counts=path_counts)
+
+
+def min_days_to_reach_certainty_level(probs_pb_ge_pa, days, required_pb_ge_pa):
+    # works along the last axis: returns one value per simulation
+    prob_gt_required = (probs_pb_ge_pa > required_pb_ge_pa) | (probs_pb_ge_pa < 1 - required_pb_ge_pa)
+    first_reached = days[np.argmax(prob_gt_required, axis=-1)]
+    min_reached = np.where(prob_gt_required[..., -1], first_reached, np.max(days))
+    return min_reached
+
+
+def min_days_incremental(s_a, s_b, days, pb_gt_pa_required, stopping='last_day',
+                         n_cmp=10000, method='quad', random_state=None, sampling='random',
+                         path_counts=None, progress=None):
+    # Same result as min_days_to_reach_certainty_level on full trajectories
+    # for stopping='last_day', but P(B>A) is evaluated day by day only for
+    # simulations whose outcome is still undecided.
+    # Returns min days and whether certainty was reached;
+    # progress(fraction_done) is called after each day.
+    if stopping not in STOPPING_RULES:
+        raise ValueError(f"Unknown stopping rule '{stopping}', expected one of {STOPPING_RULES}")
+    n_simulations = s_a['alpha_post'].shape[0]
+
+    def reached_on(day, idx):
+        p = pb_gt_pa(s_a['alpha_post'][idx, day], s_a['beta_post'][idx, day],
+                     s_b['alpha_post'][idx, day], s_b['beta_post'][idx, day],
+                     method=method, n_cmp=n_cmp, random_state=random_state,
+                     threshold=pb_gt_pa_required, sampling=sampling, path_counts=path_counts)
+        return (p > pb_gt_pa_required) | (p < 1 - pb_gt_pa_required)
+
+    min_days = np.full(n_simulations, np.max(days))
+    active = np.arange(n_simulations)
+    if stopping == 'last_day':
+        reached = reached_on(-1, active)
+        active = active[reached]
+    else:
+        reached = np.zeros(n_simulations, dtype=bool)
+    for day in range(len(days)):
+        if not active.size:
+            break
+        hit = reached_on(day, active)
+        min_days[active[hit]] = days[day]
+        reached[active[hit]] = True
+        active = active[~hit]
+        if progress is not None:
+            progress((day + 1) / len(days))
+    if progress is not None:
+        progress(1.0)
+    return min_days, reached
+
+
+def duration_simulations(a_p_sim, b_p_sim, a_trials, b_trials,
+                         a_alpha, a_beta, b_alpha, b_beta,
+                         pb_gt_pa_required=None, n_cmp=10000, method='quad',
+                         random_state=None, progress=None, stopping=None, trajectories=True,
+                         sampling='random'):
+    # all simulations at once, in blocks sized to ELEMENTS_PER_BLOCK;
+    # progress(fraction_done) is called after each block, and with a
+    # stopping rule after each day of a block.
+    # Without pb_gt_pa_required only the trajectories are returned.
+    # With a stopping rule only min days and whether certainty was
+    # reached are computed, see min_days_incremental.
+    # With trajectories=False the posteriors are dropped block by block and
+    # only the per-simulation columns and results are kept; days and
+    # trials are stored once for all simulations.
+    # method='auto' adds 'path_counts' of the P(B>A) evaluations.
+    # One generator serves both groups and all blocks, so an int
+    # random_state does not repeat the same draws.
+    rng = np.random.default_rng(random_state)
+    n_simulations = len(a_p_sim)
+    path_counts = {} if method == 'auto' else None
+    days = np.arange(len(a_trials))
+    sims_per_block = max(1, ELEMENTS_PER_BLOCK // (QUAD_NODES * len(days)))
+    blocks = []
+    for start in range(0, n_simulations, sims_per_block):
+        stop = min(start + sims_per_block, n_simulations)
+        s_a = simulate(a_p_sim[start:stop], a_trials, a_alpha, a_beta, random_state=rng)
+        s_b = simulate(b_p_sim[start:stop], b_trials, b_alpha, b_beta, random_state=rng)
+        if stopping is None:
+            pb_ge_pa = pb_ge_pa_sims(s_a, s_b, n_cmp=n_cmp, method=method, random_state=rng,
+                                     threshold=pb_gt_pa_required, sampling=sampling,
+                                     path_counts=path_counts)
+        else:
+            block_progress = None
+            if progress is not None:
+                def block_progress(fraction_done, start=start, stop=stop):
+                    progress((start + fraction_done * (stop - start)) / n_simulations)
+            pb_ge_pa = min_days_incremental(s_a, s_b, days, pb_gt_pa_required, stopping=stopping,
+                                            n_cmp=n_cmp, method=method, random_state=rng,
+                                            sampling=sampling, path_counts=path_counts,
+                                            progress=block_progress)
+        if not trajectories:
+            s_a, s_b = {'p': s_a['p']}, {'p': s_b['p']}
+        blocks.append((s_a, s_b, pb_ge_pa))
+        if progress is not None:
+            progress(stop / n_simulations)
+    sims = {
+        'A': {k: np.concatenate([b[0][k] for b in blocks]) for k in blocks[0][0]},
+        'B': {k: np.concatenate([b[1][k] for b in blocks]) for k in blocks[0][1]},
+        'days': days,
+        'pb_gt_pa_required': pb_gt_pa_required
+    }
+    if stopping is None:
+        sims['pb_ge_pa'] = np.concatenate([b[2] for b in blocks])
+    else:
+        sims['min_days_to_reach_certainty_lvl'] = np.concatenate([b[2][0] for b in blocks])
+        sims['reached'] = np.concatenate([b[2][1] for b in blocks])
+    sims['A']['trials_accum'] = np.cumsum(a_trials)
+    sims['B']['trials_accum'] = np.cumsum(b_trials)
+    sims['N'] = sims['A']['trials_accum'] + sims['B']['trials_accum']
+    if path_counts is not None:
+        sims['path_counts'] = path_counts
+    if stopping is None and pb_gt_pa_required is not None:
+        sims['min_days_to_reach_certainty_lvl'] = min_days_to_reach_certainty_level(
+            sims['pb_ge_pa'], days, pb_gt_pa_required)
+    return sims
+
+
+def min_days_to_reach_p_best(probs_best, days, required):
+    # probs_best: (..., days, arms); certainty is reached when some arm
+    # is best with probability above required, and has to hold on the last day
+    prob_gt_required = np.max(probs_best, axis=-1) > required
+    first_reached = days[np.argmax(prob_gt_required, axis=-1)]
+    return np.where(prob_gt_required[..., -1], first_reached, np.max(days))
+
+
+def concat_simulations(parts):
+    # joins results of duration_simulations for disjoint sets of simulations
+    sims = dict(parts[0])
+    for gr in ('A', 'B'):
+        sims[gr] = dict(parts[0][gr])
+        for k in ('p',) + TRAJECTORY_KEYS:
+            if k in sims[gr]:
+                sims[gr][k] = np.concatenate([s[gr][k] for s in parts])
+    for k in ('pb_ge_pa', 'min_days_to_reach_certainty_lvl', 'reached'):
+        if k in sims:
+            sims[k] = np.concatenate([s[k] for s in parts])
+    if 'path_counts' in sims:
+        sims['path_counts'] = sum_path_counts(s['path_counts'] for s in parts)
+    return sims
+
+
+def sum_path_counts(counts):
+    total = {}
+    for c in counts:
+        for path, n in c.items():
+            total[path] = total.get(path, 0) + n
+    return total
+
+
+def _map_chunks(func, n_simulations, seed, args, n_workers, executor, progress=None):
+    # func(seed_seq, n_simulations_in_chunk, *args, chunk_progress) for
+    # every chunk. progress(fraction_done) is called whenever a chunk
+    # calls its chunk_progress, or, for chunks in other processes, only
+    # after each chunk in chunk order; an exception it raises stops the
+    # reporting chunk and the chunks not yet started.
+    chunk_sizes = [min(SIMULATIONS_PER_STREAM, n_simulations - start)
+                   for start in range(0, n_simulations, SIMULATIONS_PER_STREAM)]
+    seed_seqs = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    chunk_args = [seed_seqs, chunk_sizes] + [[x] * len(chunk_sizes) for x in args]
+    serial = n_workers == 1 or len(chunk_sizes) == 1
+    if progress is not None and (serial or executor == 'thread'):
+        chunk_args.append(_chunk_progress(chunk_sizes, progress))
+        progress = None
+    else:
+        chunk_args.append([None] * len(chunk_sizes))
+    if serial:
+        results = map(func, *chunk_args)
+        return _collect_chunks(results, chunk_sizes, progress)
+    pool = ThreadPoolExecutor if executor == 'thread' else ProcessPoolExecutor
+    ex = pool(max_workers=n_workers)
+    try:
+        return _collect_chunks(ex.map(func, *chunk_args), chunk_sizes, progress)
+    finally:
+        ex.shutdown(cancel_futures=True)
+
+
+def _chunk_progress(chunk_sizes, progress):
+    # one progress function per chunk, each reporting the fraction of all
+    # simulations done; reports are serialized so the fraction never decreases
+    done = np.zeros(len(chunk_sizes))
+    lock = threading.Lock()
+
+    def report(i, fraction_done):
+        with lock:
+            done[i] = fraction_done * chunk_sizes[i]
+            progress(np.sum(done) / np.sum(chunk_sizes))
+
+    return [functools.partial(report, i) for i in range(len(chunk_sizes))]
+
+
+def _collect_chunks(results, chunk_sizes, progress):
+    parts = []
+    for part, done in zip(results, np.cumsum(chunk_sizes)):
+        parts.append(part)
+        if progress is not None:
+            progress(done / np.sum(chunk_sizes))
+    return parts
+
+
+def _simulations_chunk(seed_seq, n_simulations, a_alpha, a_beta, b_alpha, b_beta,
+                       a_trials, b_trials, n_cmp, method, pb_gt_pa_required, stopping,
+                       trajectories, sampling, progress=None):
+    rng = np.random.default_rng(seed_seq)
+    a_p_sim = rng.beta(a_alpha, a_beta, size=n_simulations)
+    b_p_sim = rng.beta(b_alpha, b_beta, size=n_simulations)
+    return duration_simulations(a_p_sim, b_p_sim, a_trials, b_trials,
+                                a_alpha, a_beta, b_alpha, b_beta,
+                                pb_gt_pa_required=pb_gt_pa_required, n_cmp=n_cmp,
+                                method=method, random_state=rng, progress=progress, stopping=stopping,
+                                trajectories=trajectories, sampling=sampling)
+
+
+def run_duration_simulations(a_alpha, a_beta, b_alpha, b_beta,
+                             daily_users, b_split, max_days, n_simulations,
+                             seed, n_cmp=10000, method='quad',
+                             n_workers=1, executor='thread',
+                             pb_gt_pa_required=None, stopping=None, trajectories=True,
+                             sampling='random', progress=None):
+    # conversions drawn from Beta(alpha, beta) for each group,
+    # then max_days days of daily_users split between A and B.
+    # Simulations are split in chunks of SIMULATIONS_PER_STREAM, each with
+    # its own generator spawned from SeedSequence(seed), so the result
+    # does not depend on n_workers. n_workers=None uses all CPUs;
+    # executor is 'thread' or 'process'. A stopping rule from
+    # STOPPING_RULES needs pb_gt_pa_required and skips P(B>A) trajectories;
+    # trajectories=False also drops the posterior trajectories.
+    # sampling applies to method='mc', see coinflip.compare.SAMPLING.
+    # progress(fraction_done) is called as chunks of simulations progress,
+    # see _map_chunks.
+    trials = np.append(0, np.full(fill_value=daily_users, shape=max_days))
+    a_trials = np.rint(trials * (1 - b_split)).astype(int)
+    b_trials = np.rint(trials * b_split).astype(int)
+    parts = _map_chunks(_simulations_chunk, n_simulations, seed,
+                        (a_alpha, a_beta, b_alpha, b_beta, a_trials, b_trials, n_cmp, method,
+                         pb_gt_pa_required, stopping, trajectories, sampling),
+                        n_workers, executor, progress)
+    return concat_simulations(parts)
+
+
+def _sweep_chunk(seed_seq, n_simulations, a_alpha, a_beta, b_alpha, b_beta,
+                 daily_users_grid, b_split_grid, max_days, pb_gt_pa_required, stopping,
+                 n_cmp, method, progress=None):
+    # Common random numbers: the prior draws and the uniform variates
+    # behind daily conversions are shared by every grid cell, conversions
+    # come from the binomial inverse cdf, so they are monotone in traffic.
+    import scipy.stats as stats
+    rng = np.random.default_rng(seed_seq)
+    a_p_sim = rng.beta(a_alpha, a_beta, size=n_simulations)[:, np.newaxis]
+    b_p_sim = rng.beta(b_alpha, b_beta, size=n_simulations)[:, np.newaxis]
+    a_u = 1 - rng.random((n_simulations, max_days))
+    b_u = 1 - rng.random((n_simulations, max_days))
+    s_a = {'alpha_post': [], 'beta_post': []}
+    s_b = {'alpha_post': [], 'beta_post': []}
+    for daily_users, b_split in itertools.product(daily_users_grid, b_split_grid):
+        for s, u, p_sim, alpha, beta, split in ((s_a, a_u, a_p_sim, a_alpha, a_beta, 1 - b_split),
+                                                (s_b, b_u, b_p_sim, b_alpha, b_beta, b_split)):
+            trials = np.append(0, np.full(max_days, np.rint(daily_users * split)))
+            conv = np.zeros((n_simulations, max_days + 1))
+            conv[:, 1:] = stats.binom.ppf(u, trials[1:], p_sim)
+            conv_accum = np.cumsum(conv, axis=-1)
+            s['alpha_post'].append(alpha + conv_accum)
+            s['beta_post'].append(beta + np.cumsum(trials) - conv_accum)
+    s_a = {k: np.concatenate(v) for k, v in s_a.items()}
+    s_b = {k: np.concatenate(v) for k, v in s_b.items()}
+    # all cells go through the stopping rule as one batch
+    path_counts = {}
+    min_days, reached = min_days_incremental(s_a, s_b, np.arange(max_days + 1), pb_gt_pa_required,
+                                             stopping=stopping, n_cmp=n_cmp, method=method,
+                                             random_state=rng, path_counts=path_counts,
+                                             progress=progress)
+    shape = (len(daily_users_grid), len(b_split_grid), n_simulations)
+    return min_days.reshape(shape), reached.reshape(shape), path_counts
+
+
+def run_duration_sweep(a_alpha, a_beta, b_alpha, b_beta, daily_users_grid, b_split_grid,
+                       max_days, n_simulations, seed, pb_gt_pa_required,
+                       stopping='last_day', n_cmp=10000, method='quad',
+                       n_workers=1, executor='thread', progress=None):
+    # Days to reach certainty over a (daily users x B split) grid in one job.
+    # Returns 'min_days' and 'reached' of shape (daily users, B split, simulations)
+    # and their per-cell 'median_days' and 'reached_share';
+    # method='auto' adds 'path_counts' of the P(B>A) evaluations.
+    daily_users_grid = np.asarray(daily_users_grid)
+    b_split_grid = np.asarray(b_split_grid)
+    parts = _map_chunks(_sweep_chunk, n_simulations, seed,
+                        (a_alpha, a_beta, b_alpha, b_beta, daily_users_grid, b_split_grid,
+                         max_days, pb_gt_pa_required, stopping, n_cmp, method),
+                        n_workers, executor, progress)
+    min_days = np.concatenate([part[0] for part in parts], axis=-1)
+    reached = np.concatenate([part[1] for part in parts], axis=-1)
+    sweep = {
+        'daily_users': daily_users_grid,
+        'b_split': b_split_grid,
+        'min_days': min_days,
+        'reached': reached,
+        'median_days': np.median(min_days, axis=-1),
+        'reached_share': np.mean(reached, axis=-1),
+    }
+    if method == 'auto':
+        sweep['path_counts'] = sum_path_counts(part[2] for part in parts)
+    return sweep
+
+
+def _arm_simulations_chunk(seed_seq, n_simulations, alphas, betas, trials, n_cmp, method, trajectories,
+                           sampling, progress=None):
+    rng = np.random.default_rng(seed_seq)
+    p_sim = rng.beta(alphas, betas, size=(n_simulations, len(alphas)))
+    s = simulate(p_sim, trials, alphas[:, np.newaxis], betas[:, np.newaxis], random_state=rng)
+    s['p_best'] = p_best(np.swapaxes(s['alpha_post'], -1, -2), np.swapaxes(s['beta_post'], -1, -2),
+                         method=method, n_cmp=n_cmp, random_state=rng, sampling=sampling)
+    if not trajectories:
+        s = {k: s[k] for k in ('p', 'trials_accum', 'p_best')}
+    if progress is not None:
+        progress(1.0)
+    return s
+
+
+def run_arm_simulations(alphas, betas, daily_users, splits, max_days, n_simulations,
+                        seed, n_cmp=10000, method='mc', n_workers=1, executor='thread',
+                        trajectories=True, sampling='random', progress=None):
+    # Duration simulations for any number of arms: alphas, betas and
+    # traffic splits have one value per arm. Returns posteriors of shape
+    # (n_simulations, arms, days) and 'p_best' of shape (n_simulations, days, arms);
+    # trajectories=False keeps only 'p' and 'p_best';
+    # sampling as for coinflip.compare.p_best.
+    alphas = np.asarray(alphas, dtype=float)
+    betas = np.asarray(betas, dtype=float)
+    trials = np.append(0, np.full(fill_value=daily_users, shape=max_days))
+    trials = np.rint(trials * np.asarray(splits)[:, np.newaxis]).astype(int)
+    parts = _map_chunks(_arm_simulations_chunk, n_simulations, seed,
+                        (alphas, betas, trials, n_cmp, method, trajectories, sampling), n_workers, executor,
+                        progress)
+    sims = {k: np.concatenate([s[k] for s in parts]) for k in parts[0] if k != 'trials_accum'}
+    sims['trials_accum'] = parts[0]['trials_accum']
+    sims['days'] = np.arange(max_days + 1)
+    return sims
@@ -0,0 +1,143 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from coinflip.compare import p_best
+from coinflip.posterior import HPDI_NORMAL_TOL, alpha_beta_post, beta_hpdi
+
+# Append-only store of per-experiment daily counts and the per-day results
+# derived from them (accumulated counts, HPDI, P(best)) in SQLite.
+# A new day needs only the last stored accumulated counts, so a refresh
+# costs O(new days) whatever the length of the experiment. Stored days
+# whose counts changed since, e.g. a partially logged last day or late
+# conversions, are recomputed from the first changed day on. Sessions
+# refreshing the same experiment concurrently write the same rows, the
+# later write replaces the earlier one.
+HPDI = 0.95
+N_CMP = 30000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiments (
+    experiment TEXT PRIMARY KEY,
+    groups TEXT NOT NULL,
+    hpdi REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS days (
+    experiment TEXT NOT NULL,
+    grp TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    n_users INTEGER NOT NULL,
+    conv INTEGER NOT NULL,
+    n_users_accum INTEGER NOT NULL,
+    conv_accum INTEGER NOT NULL,
+    p_hpdi_lower REAL,
+    p_hpdi_higher REAL,
+    p_best REAL,
+    PRIMARY KEY (experiment, day, grp)
+);
+"""
+
+
+def open_store(path):
+    con = sqlite3.connect(path)
+    con.executescript(SCHEMA)
+    return con
+
+
+def last_day(con, experiment):
+    # None for an experiment without stored days
+    return con.execute("SELECT MAX(day) FROM days WHERE experiment = ?", (experiment,)).fetchone()[0]
+
+
+def append_days(con, experiment, df_new, hpdi=HPDI, seed=7):
+    # df_new: group, day, n_users, conv for days after the last stored one,
+    # every group present on every day
+    counts = df_new.pivot(index='day', columns='group', values=['n_users', 'conv']).sort_index()
+    if counts.isna().any().any():
+        raise ValueError(f"Experiment '{experiment}': every group needs a row for every day")
+    groups = list(counts['n_users'].columns)
+    row = con.execute("SELECT groups, hpdi FROM experiments WHERE experiment = ?", (experiment,)).fetchone()
+    stored_last_day = last_day(con, experiment)
+    if row is None:
+        con.execute("INSERT OR IGNORE INTO experiments VALUES (?, ?, ?)", (experiment, ','.join(groups), hpdi))
+    elif row[0].split(',') != groups:
+        raise ValueError(f"Experiment '{experiment}' has groups {row[0].split(',')}, got {groups}")
+    else:
+        hpdi = row[1]
+    if stored_last_day is None:
+        n_users_prev = conv_prev = np.zeros(len(groups), dtype=np.int64)
+    else:
+        if counts.index[0] <= stored_last_day:
+            raise ValueError(f"Experiment '{experiment}' already has days up to {stored_last_day}")
+        prev = pd.read_sql_query("SELECT grp, n_users_accum, conv_accum FROM days "
+                                 "WHERE experiment = ? AND day = ?",
+                                 con, params=(experiment, stored_last_day), index_col='grp').loc[groups]
+        n_users_prev = prev['n_users_accum'].to_numpy()
+        conv_prev = prev['conv_accum'].to_numpy()
+
+    # (new days, groups)
+    n_users = counts['n_users'].to_numpy(dtype=np.int64)
+    conv = counts['conv'].to_numpy(dtype=np.int64)
+    n_users_accum = n_users_prev + np.cumsum(n_users, axis=0)
+    conv_accum = conv_prev + np.cumsum(conv, axis=0)
+    alpha, beta = alpha_beta_post(alpha=1, beta=1, n_conv=conv_accum, n_total=n_users_accum)
+    hpdi_lower, hpdi_higher = beta_hpdi(hpdi, alpha, beta, normal_tol=HPDI_NORMAL_TOL)
+    if len(groups) == 2:
+        probs_best = p_best(alpha, beta, method='auto')
+    else:
+        probs_best = p_best(alpha, beta, method='mc', n_cmp=N_CMP, random_state=seed)
+
+    days = np.broadcast_to(counts.index.to_numpy()[:, np.newaxis], n_users.shape)
+    grps = np.broadcast_to(np.array(groups, dtype=object), n_users.shape)
+    rows = zip(*(x.ravel().tolist() for x in (grps, days, n_users, conv, n_users_accum, conv_accum,
+                                               hpdi_lower, hpdi_higher, probs_best)))
+    with con:
+        con.executemany("INSERT OR REPLACE INTO days VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        ((experiment,) + r for r in rows))
+    return len(counts)
+
+
+def update_experiment(con, experiment, df, hpdi=HPDI, seed=7):
+    # df: the full daily table of the experiment, e.g. from
+    # aggregate_user_log; days after the last stored one are appended,
+    # stored days are dropped and appended again from the first one whose
+    # counts differ from df. Returns the number of appended days.
+    first_changed = _first_changed_day(con, experiment, df)
+    if first_changed is not None:
+        df = df[df['day'] >= first_changed]
+    if df.empty:
+        return 0
+    try:
+        if first_changed is not None:
+            con.execute("DELETE FROM days WHERE experiment = ? AND day >= ?", (experiment, first_changed))
+        return append_days(con, experiment, df, hpdi=hpdi, seed=seed)
+    except BaseException:
+        con.rollback()
+        raise
+
+
+def _first_changed_day(con, experiment, df):
+    # the first stored day whose counts differ from df or that df lacks,
+    # else the day after the last stored one; None without stored days
+    stored = pd.read_sql_query("SELECT grp AS 'group', day, n_users, conv FROM days WHERE experiment = ?",
+                               con, params=(experiment,))
+    if stored.empty:
+        return None
+    merged = stored.merge(df[['group', 'day', 'n_users', 'conv']], on=['group', 'day'], how='left',
+                          suffixes=('', '_new'))
+    changed = ((merged['n_users'] != merged['n_users_new'])
+               | (merged['conv'] != merged['conv_new']))
+    if changed.any():
+        return int(merged.loc[changed, 'day'].min())
+    return int(stored['day'].max()) + 1
+
+
+def read_experiment(con, experiment):
+    # stored days in the layout of the Conversions page
+    df = pd.read_sql_query("SELECT grp AS 'group', day, n_users, conv, n_users_accum, conv_accum, "
+                           "p_hpdi_lower, p_hpdi_higher, p_best FROM days "
+                           "WHERE experiment = ? ORDER BY grp, day",
+                           con, params=(experiment,))
+    df['p_accum'] = df['conv_accum'] / df['n_users_accum']
+    return df
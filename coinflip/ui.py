@@ -0,0 +1,63 @@
+import numpy as np
+import plotly.graph_objects as go
+import streamlit as st
+
+from coinflip import simulation
+from coinflip.background import shared_run
+from coinflip.cache import IGNORED_ARGS, cache_key, disk_cached
+
+# Settings, figures and simulation runs shared by the Streamlit pages. The
+# rest of the package does not import streamlit.
+SEED = 7
+CACHE_MAX_ENTRIES = 32
+GROUPS = 'ABCDEFGH'
+# P(best) for more than two groups is Monte Carlo, one draw per sample for all groups
+ARMS_N_CMP = 2000
+
+# the simulations run off the script thread (see run_with_progress),
+# where st.cache_data has no script context, so they are cached by coinflip
+run_duration_simulations = disk_cached(simulation.run_duration_simulations, memory_entries=CACHE_MAX_ENTRIES)
+run_arm_simulations = disk_cached(simulation.run_arm_simulations, memory_entries=CACHE_MAX_ENTRIES)
+run_duration_sweep = disk_cached(simulation.run_duration_sweep, memory_entries=CACHE_MAX_ENTRIES)
+
+
+def run_with_progress(text, func, *args, **kwargs):
+    # func(*args, progress=..., **kwargs) runs off the script thread with a
+    # progress bar updated at most 10 times a second. Runs are shared by
+    # their arguments: a rerun with the same inputs, from this session or
+    # another, attaches to the run in flight, and one left without
+    # sessions is cancelled, see shared_run. The pages pass n_workers=1:
+    # the background pool already runs up to RUN_WORKERS runs at once, so
+    # per-run pools would only oversubscribe the CPUs.
+    key = cache_key(f'{func.__module__}.{func.__qualname__}',
+                    {'args': args, 'kwargs': {k: v for k, v in kwargs.items() if k not in IGNORED_ARGS}})
+    bar = st.progress(0.0, text=text)
+    try:
+        return shared_run(key, lambda progress: func(*args, progress=progress, **kwargs),
+                          lambda fraction_done: bar.progress(fraction_done, text=text))
+    finally:
+        bar.empty()
+
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def days_to_certainty_figure(n_reached_freqs, x_med, pb_gt_pa_required, max_days, days_label='Days'):
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=n_reached_freqs.index,
+                         y=n_reached_freqs['freq'],
+                         width=[1] * len(n_reached_freqs),
+                         marker_color='red',
+                         opacity=0.6,
+                         name='Simulations Reached Certainty'))
+    fig.add_trace(go.Scatter(x=[x_med, x_med], y=[0, np.max(n_reached_freqs['freq'])],
+                             line_color='black',
+                             line_dash='dash',
+                             mode='lines',
+                             hovertemplate=f"Median: {x_med}",
+                             name='Median'))
+    fig.update_layout(title=f'{days_label} to Reach {pb_gt_pa_required*100:.0f}% Certainty')
+    fig.update_layout(xaxis_title=days_label,
+                      yaxis_title='Part from Total Simulations',
+                      showlegend=False)
+    fig.update_xaxes(range=[0, max_days + 1])
+    fig.update_layout(yaxis_rangemode='tozero')
+    return fig
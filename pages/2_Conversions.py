@@ -1,105 +1,294 @@
+import os
+import sqlite3
+from contextlib import closing
+
 import numpy as np
 import pandas as pd
-import scipy.stats as stats
 import plotly.graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
 import streamlit as st
 
-#from numpy.random import default_rng
-#rng = default_rng(17)
-np.random.seed(7)   
+from coinflip.compare import p_best, posterior_summary
+from coinflip.ingest import CONV_COLUMN, DAY_COLUMN, GROUP_COLUMN, aggregate_user_log
+from coinflip.plotting import DENSITY_POINTS, HISTOGRAM_BINS, density_grid, histogram
+from coinflip.posterior import HPDI_NORMAL_TOL, alpha_beta_post, beta_hpdi, beta_mean_std, beta_pdf
+from coinflip.profiling import Profiler, profiling_enabled
+from coinflip.store import HPDI, open_store, read_experiment, update_experiment
+from coinflip.simulation import min_days_to_reach_certainty_level, min_days_to_reach_p_best
+from coinflip.ui import (ARMS_N_CMP, CACHE_MAX_ENTRIES, GROUPS, SEED, days_to_certainty_figure,
+                         run_arm_simulations, run_duration_simulations, run_with_progress)
 
-def posterior_for_binom_and_uniform_prior(p, n_heads, n_trials):
-    alpha_prior = 1
-    beta_prior = 1
-    alpha_post = alpha_prior + n_heads
-    beta_post = beta_prior + (n_trials - n_heads)
-    return stats.beta.pdf(p, alpha_post, beta_post)
+GROUP_COLORS = ['red', 'blue', 'green', 'purple', 'brown', 'magenta', 'olive', 'gray']
 
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
 def hpdi_for_binom_and_uniform_prior(hpdi, n_heads, n_trials):
-    #todo: switch to built-in quantile functions?
-    p_grid = np.linspace(start=0, stop=1, num=3001)
-    p_posterior = np.array([posterior_for_binom_and_uniform_prior(p, n_heads, n_trials) for p in p_grid])
-    norm = np.sum(p_posterior)
-    n_start = np.argmax(p_posterior)
-    n_left = n_start
-    n_right = n_start
-    s = p_posterior[n_start]
-    while s < hpdi * norm:
-        next_left = p_posterior[n_left - 1]
-        next_right = p_posterior[n_right + 1]
-        if next_left > next_right:
-            n_left = n_left - 1
-            s = s + next_left
-        elif next_left < next_right:
-            n_right = n_right + 1
-            s = s + next_right
-        else:
-            n_left = n_left - 1
-            n_right = n_right + 1
-            s = s + next_left + next_right
-    return (p_grid[n_left], p_grid[n_right])
-
-def posterior_sample_for_binom_and_uniform_prior(ns, ntotal, n_sample):
     alpha_prior = 1
     beta_prior = 1
-    a = alpha_prior + ns
-    b = beta_prior + (ntotal - ns) 
-    return np.random.beta(a, b, n_sample)
-
-def alpha_beta_post(alpha, beta, n_conv, n_total):
-    alpha_post = alpha + n_conv
-    beta_post = beta + (n_total - n_conv)
-    return alpha_post, beta_post
-
-def beta_post_dist(alpha, beta, n_conv, n_total):
-    alpha_post = alpha + n_conv
-    beta_post = beta + (n_total - n_conv)
-    return stats.beta(a=alpha_post, b=beta_post)
-
-def prob_pb_gt_pa(p_a, p_b, N_a, N_b = None):
-    N_b = N_a if N_b is None else N_b
-    n_sample = 30000
-    post_sample_a = posterior_sample_for_binom_and_uniform_prior(p_a * N_a, N_a, n_sample)
-    post_sample_b = posterior_sample_for_binom_and_uniform_prior(p_b * N_b, N_b, n_sample)
-    post_sample_diff = post_sample_b - post_sample_a
-    prob_b_gt_a = len(post_sample_diff[post_sample_diff > 0]) / len(post_sample_diff)
-    return prob_b_gt_a
-
-def pb_ge_pa_sims(s_a, s_b, n_cmp=30000):
-    n_pars = len(s_a['alpha_post'])
-    pa = stats.beta.rvs(s_a['alpha_post'], s_a['beta_post'], size=(n_cmp, n_pars))
-    pb = stats.beta.rvs(s_b['alpha_post'], s_b['beta_post'], size=(n_cmp, n_pars))
-    return np.sum(pb >= pa, axis=0) / n_cmp   
-
-def simulate(p, trials, alpha, beta):
-    trials_conv = stats.binom.rvs(n=trials, p=p)
-    trials_accum = np.cumsum(trials)
-    trials_conv_accum = np.cumsum(trials_conv)
-    alpha_post = trials_conv_accum + alpha
-    beta_post = (trials_accum - trials_conv_accum) + beta
-    s = {
-        'p': p,
-        'trials_accum': trials_accum,
-        'trials_conv_accum': trials_conv_accum,
-        'alpha_post': alpha_post,
-        'beta_post': beta_post
-    }
-    return s 
-
-def min_days_to_reach_certainty_level(probs_pb_ge_pa, days, required_pb_ge_pa):
-    prob_gt_required = (probs_pb_ge_pa > required_pb_ge_pa) | (probs_pb_ge_pa < 1 - required_pb_ge_pa)
-    reached = days[prob_gt_required]
-    min_reached = np.min(reached) if prob_gt_required[-1] else np.max(days)
-    return min_reached
- 
+    alpha_post = alpha_prior + n_heads
+    beta_post = beta_prior + (n_trials - n_heads)
+    path_counts = {}
+    lower, upper = beta_hpdi(hpdi, alpha_post, beta_post, normal_tol=HPDI_NORMAL_TOL, path_counts=path_counts)
+    return lower, upper, path_counts
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def prob_best_group(conv_accum, n_users_accum):
+    # conv_accum, n_users_accum: (days, groups); two groups use the
+    # deterministic P(p_B > p_A), more groups one shared Monte Carlo draw.
+    # Also returns the path counts of the deterministic evaluations.
+    alpha, beta = alpha_beta_post(alpha=1, beta=1, n_conv=conv_accum, n_total=n_users_accum)
+    path_counts = {}
+    if alpha.shape[-1] == 2:
+        return p_best(alpha, beta, method='auto', path_counts=path_counts), path_counts
+    return p_best(alpha, beta, method='mc', n_cmp=30000, random_state=SEED), path_counts
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def generate_data(convs_exact, daily_users, n_days, splits, seed):
+    rng = np.random.default_rng(seed)
+    trials = np.full(fill_value=daily_users, shape=n_days)
+    dfs = []
+    for group, conv_exact, split in zip(GROUPS, convs_exact, splits):
+        group_trials = np.rint(trials * split).astype(int)
+        group_trials_conv = rng.binomial(n=group_trials, p=conv_exact)
+        dfs.append(pd.DataFrame({'group': np.full(fill_value=group, shape=len(group_trials)),
+                                 'day': np.arange(len(group_trials)),
+                                 'n_users': group_trials,
+                                 'conv': group_trials_conv}))
+    df_exp = pd.concat(dfs)
+    return df_exp
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def load_event_log(path, mtime, group_col, day_col, conv_col):
+    # mtime is only part of the cache key
+    return aggregate_user_log(path, group_col=group_col, day_col=day_col, conv_col=conv_col)
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def posterior_summary_for_groups(conv, n_users, n_sample, hpdi, seed):
+    # one posterior sample for all groups, the first group is the baseline
+    alpha, beta = alpha_beta_post(alpha=1, beta=1, n_conv=conv, n_total=n_users)
+    return posterior_summary(alpha, beta, n_sample=n_sample, hpdi=hpdi, random_state=seed)
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def daily_and_total_figure(df_plot, df_summary, column, title, yaxis_title):
+    from plotly.subplots import make_subplots
+    fig = make_subplots(rows=1, cols=2, 
+                        column_widths=[0.85, 0.15],
+                        subplot_titles=("Daily", "Total"))
+    for gr in df_plot.index.unique():
+        fig.add_trace(
+            go.Scatter(x=df_plot['day'][gr], y=df_plot[column][gr], 
+                       line_color=df_summary['col'][gr],
+                       name=gr),
+            row=1, col=1
+        )
+        fig.add_trace(
+            go.Bar(x=[gr], y=[df_summary[column][gr]],
+                   marker_color=df_summary['col'][gr],
+                   name=gr),
+            row=1, col=2
+        )
+    fig.update_layout(title_text=title)
+    fig.update_xaxes(title_text="Days", row=1, col=1)
+    fig.update_yaxes(title_text=yaxis_title, row=1, col=1)
+    fig.update_xaxes(title_text="Groups", row=1, col=2)
+    fig.update_layout(yaxis_rangemode='tozero')
+    return fig
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def accumulated_conversions_figure(df_plot, df_summary, hpdi):
+    from plotly.subplots import make_subplots
+    fig = make_subplots(rows=1, cols=2,
+                        shared_yaxes=True,
+                        column_widths=[0.85, 0.15],
+                        subplot_titles=("Daily", "Total"))
+    for gr in df_plot.index.unique():
+        fig.add_trace(
+            go.Scatter(x=df_plot['day'][gr], y=df_plot['p_accum'][gr],
+                       line_color=df_summary['col'][gr],
+                       name=gr),
+            row=1, col=1)
+        fig.add_trace(
+            go.Scatter(x=pd.concat([df_plot['day'][gr], df_plot['day'][gr][::-1], df_plot['day'][gr][0:1]]),
+                       y=pd.concat([df_plot['p_hpdi_higher'][gr], df_plot['p_hpdi_lower']
+                                    [gr][::-1], df_plot['p_hpdi_higher'][gr][0:1]]),
+                       fill='toself', name=f'{hpdi:.0%} HPDI A',
+                       hoveron='points+fills',
+                       hoverinfo='text+x+y',
+                       line_color=df_summary['col'][gr], fillcolor=df_summary['col'][gr], opacity=0.4),
+            row=1, col=1)
+        fig.add_trace(
+            go.Scatter(x=[gr], y=[df_summary['p'][gr]],
+                       marker_color=df_summary['col'][gr],
+                       error_y={'array': [df_summary['p_error_higher'][gr]],
+                                'arrayminus': [df_summary['p_error_lower'][gr]]},
+                       name=gr),
+            row=1, col=2)
+    fig.update_layout(title_text='Accumulated Conversions')
+    fig.update_xaxes(title_text="Days", row=1, col=1)
+    fig.update_yaxes(title_text="Conversions", row=1, col=1)
+    fig.update_xaxes(title_text="Groups", row=1, col=2)
+    fig.update_layout(yaxis_rangemode='tozero', yaxis2_rangemode='tozero')
+    return fig
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def certainty_figure(p_best_df, df_summary, pb_gt_pa_required):
+    from plotly.subplots import make_subplots
+    fig = make_subplots(rows=1, cols=2, 
+                        column_widths=[0.85, 0.15],
+                        subplot_titles=("Daily Accumulated", "Total"))
+    if len(p_best_df.columns) == 2:
+        a, b = p_best_df.columns
+        yaxis_title = f"P(p_{b} > p_{a})"
+        fig.add_trace(go.Scatter(x=p_best_df.index, y=p_best_df[b],
+                                 name=yaxis_title, marker_color='orange',
+                                 opacity=0.6),
+                      col=1, row=1)
+        fig.add_hline(y=1 - pb_gt_pa_required, line_dash="dash", col=1, row=1)
+    else:
+        yaxis_title = "P(best)"
+        for gr in p_best_df.columns:
+            fig.add_trace(go.Scatter(x=p_best_df.index, y=p_best_df[gr],
+                                     name=f'P({gr} best)', line_color=df_summary['col'][gr],
+                                     opacity=0.6),
+                          col=1, row=1)
+    fig.add_hline(y=pb_gt_pa_required, line_dash="dash", col=1, row=1)
+    for gr in df_summary.index.unique():
+        fig.add_trace(
+            go.Bar(x=[gr], y=[df_summary['p_best_group'][gr]],
+                   name=gr,
+                   marker_color=df_summary['col'][gr], width=0.3),
+            row=1, col=2)
+    fig.update_layout(title_text='Certainty in Highest Conversion Group')
+    fig.update_xaxes(title_text="Days", row=1, col=1)
+    fig.update_yaxes(title_text=yaxis_title, row=1, col=1)
+    fig.update_xaxes(title_text="Groups", row=1, col=2)
+    fig.update_layout(yaxis_rangemode='tozero', yaxis2_rangemode='tozero')
+    return fig
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def posterior_density_figure(df_summary, n_points=DENSITY_POINTS):
+    fig = go.Figure()
+    xaxis_min = np.nan
+    xaxis_max = np.nan
+    for gr in df_summary.index.unique():
+        alpha_post, beta_post = alpha_beta_post(alpha=1, beta=1,
+                                                n_conv=df_summary['conv'][gr],
+                                                n_total=df_summary['n_users'][gr])
+        mean, std = beta_mean_std(alpha_post, beta_post)
+        xaxis_min = np.nanmin([xaxis_min, mean - 5 * std])
+        xaxis_max = np.nanmax([xaxis_max, mean + 5 * std])
+        p_grid = density_grid(mean, std, n_points)
+        y_plot = beta_pdf(p_grid, alpha_post, beta_post)
+        fig.add_trace(go.Scatter(x=p_grid, y=y_plot, mode='lines',
+                                 name=gr,
+                                 line_color=df_summary['col'][gr]))
+    xaxis_min = np.floor(xaxis_min * 100) / 100
+    xaxis_max = np.ceil(xaxis_max * 100) / 100
+    fig.update_xaxes(range=[xaxis_min, xaxis_max])
+    fig.update_layout(title='Conversions Prob Density Estimates',
+                      yaxis_title='Prob Density',
+                      xaxis_title='p',
+                      hovermode="x")
+    return fig
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def relation_figure(post_sample_rels, df_summary, baseline, bins=HISTOGRAM_BINS):
+    fig = go.Figure()
+    for gr, post_sample_rel in post_sample_rels.items():
+        # binned here, the raw sample is not sent to the browser
+        centers, density, widths = histogram(post_sample_rel, bins)
+        fig.add_trace(go.Bar(x=centers, y=density, width=widths,
+                             name=f'{gr}/{baseline}',
+                             marker_color='orange' if len(post_sample_rels) == 1 else df_summary['col'][gr],
+                             marker_line_width=0,
+                             opacity=0.6))
+    fig.add_vline(x=1, line_dash="dash")
+    fig.update_layout(title='Conversions Relation',
+                      xaxis_title=f'p / p_{baseline}',
+                      yaxis_title='Prob Density',
+                      barmode='overlay')
+    return fig
+
+@st.fragment
+def duration_estimates(groups, alphas_post, betas_post, daily_users, splits, pb_gt_pa_required):
+    # Reruns on its own when its inputs change; the simulation itself only
+    # runs on the button, its result is kept in the session until the
+    # data or the simulation inputs change.
+    profiler = Profiler(enabled=st.session_state['diagnostics'])
+    st.subheader("Duration Estimates")
+
+    col1, col2 = st.columns(2)
+    with col1: 
+        st.number_input(label='Max Days in Simulations',
+                        min_value=1,
+                        step=1,
+                        format='%d',
+                        key='conv_sim_max_days')
+    with col2: 
+        st.number_input(label='Simulations',
+                        min_value=1,
+                        step=1,
+                        format='%d',
+                        key='conv_n_simulations')
+
+    n_simulations = st.session_state['conv_n_simulations']
+    max_days = st.session_state['conv_sim_max_days']
+    sims_key = (tuple(groups), tuple(alphas_post.tolist()), tuple(betas_post.tolist()),
+                daily_users, tuple(splits), max_days, n_simulations)
+    if st.button('Run Duration Simulation', type='primary'):
+        with profiler.stage('duration_simulations'):
+            if len(groups) == 2:
+                sims = run_with_progress(f'Running {n_simulations} simulations ...',
+                                         run_duration_simulations,
+                                         alphas_post[0], betas_post[0], alphas_post[1], betas_post[1],
+                                         daily_users,
+                                         splits[1],
+                                         max_days,
+                                         n_simulations, SEED, method='auto', n_workers=1,
+                                         trajectories=False)
+            else:
+                sims = run_with_progress(f'Running {n_simulations} simulations ...',
+                                         run_arm_simulations, alphas_post, betas_post,
+                                         daily_users,
+                                         splits,
+                                         max_days,
+                                         n_simulations, SEED, n_cmp=ARMS_N_CMP, n_workers=1,
+                                         trajectories=False)
+        st.session_state['conv_duration_sims'] = (sims_key, sims)
+    if st.session_state.get('conv_duration_sims', (None,))[0] != sims_key:
+        st.info('Press "Run Duration Simulation" to estimate the additional days to reach certainty.')
+        return
+    sims = st.session_state['conv_duration_sims'][1]
+    profiler.count_paths('P(B>A)', sims.get('path_counts'))
+
+    if len(groups) == 2:
+        n_reached_hist = min_days_to_reach_certainty_level(sims['pb_ge_pa'], sims['days'], pb_gt_pa_required)
+    else:
+        n_reached_hist = min_days_to_reach_p_best(sims['p_best'], sims['days'], pb_gt_pa_required)
+    n_reached_freqs = pd.Series(n_reached_hist).value_counts(normalize=True).rename('freq').to_frame()
+    x_med = np.median(n_reached_hist)
+    if len(n_reached_freqs['freq']) == 1:
+        st.write(f"100% simulations reached certainty at day {n_reached_freqs.index[0]}")
+    else:
+        st.write(f"50% simulations reached {pb_gt_pa_required*100:.0f}% certainty at additional day {x_med:.0f} or earlier")
+
+    with profiler.stage('figures'):
+        st.plotly_chart(days_to_certainty_figure(n_reached_freqs, x_med, pb_gt_pa_required, max_days,
+                                                     days_label='Additional Days'))
+    if profiler.enabled:
+        record = profiler.finish('Conversions Comparison: Duration Estimates')
+        st.caption(" ".join(f"{s['stage']} {s['seconds']:.3f} s" for s in record['stages']))
+        for line in profiler.path_shares():
+            st.caption(line)
 
 def init_conv_session_values():
     if 'conv_a_exact' not in st.session_state:
         st.session_state['conv_a_exact'] = 15.0
     if 'conv_b_exact' not in st.session_state:
         st.session_state['conv_b_exact'] = 16.0
+    if 'conv_n_groups' not in st.session_state:
+        st.session_state['conv_n_groups'] = 2
+    for x in GROUPS[2:]:
+        if f'conv_{x.lower()}_exact' not in st.session_state:
+            st.session_state[f'conv_{x.lower()}_exact'] = 15.0
     if 'conv_daily_users' not in st.session_state:
         st.session_state['conv_daily_users'] = 3000
     if 'conv_n_days' not in st.session_state:
@@ -112,72 +301,147 @@ def init_conv_session_values():
         st.session_state['conv_sim_max_days'] = 30
     if 'conv_n_simulations' not in st.session_state:
         st.session_state['conv_n_simulations'] = 100
+    if 'conv_data_source' not in st.session_state:
+        st.session_state['conv_data_source'] = 'Generate'
+    if 'conv_log_path' not in st.session_state:
+        st.session_state['conv_log_path'] = ''
+    if 'conv_log_group_col' not in st.session_state:
+        st.session_state['conv_log_group_col'] = GROUP_COLUMN
+    if 'conv_log_day_col' not in st.session_state:
+        st.session_state['conv_log_day_col'] = DAY_COLUMN
+    if 'conv_log_conv_col' not in st.session_state:
+        st.session_state['conv_log_conv_col'] = CONV_COLUMN
+    if 'diagnostics' not in st.session_state:
+        st.session_state['diagnostics'] = profiling_enabled()
+    if 'conv_store_path' not in st.session_state:
+        st.session_state['conv_store_path'] = ''
         
 init_conv_session_values()
+
+st.sidebar.checkbox(label='Diagnostics', key='diagnostics')
+profiler = Profiler(enabled=st.session_state['diagnostics'])
 #st.session_state
 
 st.title('Conversions Comparison')
 
-st.subheader("Generate Data")
-
-col1, col2 = st.columns(2)
-
-with col1:
-    st.number_input(label='p_A Exact, %',
-                    min_value=0.0,
-                    max_value=100.0,
-                    step=0.1,
-                    format='%f',
-                    key='conv_a_exact')
-
-with col2:
-    st.number_input(label='p_B Exact, %',
-                    min_value=0.0,
-                    max_value=100.0,
-                    step=0.1,
-                    format='%f',
-                    key='conv_b_exact')
-
-st.number_input(label='Daily Users',
-                min_value=0,
-                step=100,
-                format='%d',
-                key='conv_daily_users')
-st.number_input(label='N Days',
-                min_value=0,
-                step=1,
-                format='%d',
-                key='conv_n_days')            
-st.number_input(label='B Group Traffic, %',
-                min_value=0.0,
-                max_value=100.0,
-                step=0.1,
-                format='%f',
-                key='conv_b_split')
-
-
-trials = np.full(fill_value=st.session_state['conv_daily_users'],
-                 shape=st.session_state['conv_n_days'])
-conv_b_split = st.session_state['conv_b_split'] / 100
-a_trials = np.rint(trials * (1 - conv_b_split)).astype(int)
-b_trials = np.rint(trials * conv_b_split).astype(int)
-
-conv_a_exact = st.session_state['conv_a_exact'] / 100
-conv_b_exact = st.session_state['conv_b_exact'] / 100
-a_trials_conv = stats.binom.rvs(n=a_trials, p=conv_a_exact)
-b_trials_conv = stats.binom.rvs(n=b_trials, p=conv_b_exact)
-
-df_exp = pd.concat([
-    pd.DataFrame({'group': np.full(fill_value='A', shape=len(a_trials)),
-                  'day': np.arange(len(a_trials)),
-                  'n_users': a_trials,
-                  'conv': a_trials_conv}),
-    pd.DataFrame({'group': np.full(fill_value='B', shape=len(b_trials)),
-                  'day': np.arange(len(b_trials)),
-                  'n_users': b_trials,
-                  'conv': b_trials_conv})
-])
-with st.expander("Show Generated Data"):
+st.subheader("Data")
+
+st.radio(label='Data Source',
+         options=['Generate', 'Event Log'],
+         horizontal=True,
+         key='conv_data_source')
+
+# per-day results read back from the experiment store, if one is used
+stored = None
+if st.session_state['conv_data_source'] == 'Generate':
+    st.number_input(label='Groups',
+                    min_value=2,
+                    max_value=len(GROUPS),
+                    step=1,
+                    format='%d',
+                    key='conv_n_groups')
+    groups = GROUPS[:st.session_state['conv_n_groups']]
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.number_input(label='p_A Exact, %',
+                        min_value=0.0,
+                        max_value=100.0,
+                        step=0.1,
+                        format='%f',
+                        key='conv_a_exact')
+
+    with col2:
+        st.number_input(label='p_B Exact, %',
+                        min_value=0.0,
+                        max_value=100.0,
+                        step=0.1,
+                        format='%f',
+                        key='conv_b_exact')
+
+    for i, x in enumerate(groups[2:]):
+        with (col1, col2)[i % 2]:
+            st.number_input(label=f'p_{x} Exact, %',
+                            min_value=0.0,
+                            max_value=100.0,
+                            step=0.1,
+                            format='%f',
+                            key=f'conv_{x.lower()}_exact')
+
+    st.number_input(label='Daily Users',
+                    min_value=0,
+                    step=100,
+                    format='%d',
+                    key='conv_daily_users')
+    st.number_input(label='N Days',
+                    min_value=0,
+                    step=1,
+                    format='%d',
+                    key='conv_n_days')            
+    if len(groups) == 2:
+        st.number_input(label='B Group Traffic, %',
+                        min_value=0.0,
+                        max_value=100.0,
+                        step=0.1,
+                        format='%f',
+                        key='conv_b_split')
+        conv_b_split = st.session_state['conv_b_split'] / 100
+        splits = (1 - conv_b_split, conv_b_split)
+    else:
+        st.caption(f'Traffic is split equally, {100 / len(groups):.1f}% per group')
+        splits = (1 / len(groups),) * len(groups)
+
+
+    convs_exact = tuple(st.session_state[f'conv_{x.lower()}_exact'] / 100 for x in groups)
+    with profiler.stage('data'):
+        df_exp = generate_data(convs_exact,
+                               st.session_state['conv_daily_users'],
+                               st.session_state['conv_n_days'],
+                               splits, SEED)
+    daily_users = st.session_state['conv_daily_users']
+else:
+    st.text_input(label='Event Log Path (.csv or .parquet, one row per user)',
+                  key='conv_log_path')
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.text_input(label='Group Column', key='conv_log_group_col')
+    with col2:
+        st.text_input(label='Day or Date Column', key='conv_log_day_col')
+    with col3:
+        st.text_input(label='Converted Column', key='conv_log_conv_col')
+    st.text_input(label='Experiment Store (SQLite file, optional)', key='conv_store_path')
+    log_path = st.session_state['conv_log_path']
+    if not os.path.isfile(log_path):
+        st.info('Enter the path of an event log on the server.')
+        st.stop()
+    try:
+        with st.spinner(text='Reading Event Log ...'), profiler.stage('data'):
+            df_exp = load_event_log(log_path, os.path.getmtime(log_path),
+                                    st.session_state['conv_log_group_col'],
+                                    st.session_state['conv_log_day_col'],
+                                    st.session_state['conv_log_conv_col'])
+    except ValueError as e:
+        st.error(e)
+        st.stop()
+    if df_exp['group'].nunique() < 2:
+        st.error(f"Event log needs at least two groups, got {sorted(set(df_exp['group']))}")
+        st.stop()
+    # duration estimates continue with the observed traffic
+    n_users_per_group = df_exp.groupby('group')['n_users'].sum()
+    daily_users = int(np.rint(n_users_per_group.sum() / df_exp['day'].nunique()))
+    splits = tuple(n_users_per_group / n_users_per_group.sum())
+    if st.session_state['conv_store_path']:
+        # only new or changed days are computed, the rest is read back
+        with closing(open_store(st.session_state['conv_store_path'])) as con, profiler.stage('store'):
+            try:
+                update_experiment(con, os.path.abspath(log_path), df_exp)
+            except (ValueError, sqlite3.Error) as e:
+                st.error(e)
+                st.stop()
+            stored = read_experiment(con, os.path.abspath(log_path))
+
+with st.expander("Show Data"):
     st.dataframe(df_exp)
 
 df = df_exp.copy()
@@ -191,7 +455,9 @@ st.subheader("Details")
 
 df_summary = df_exp.groupby(['group'])[['n_users', 'conv']].sum()
 df_summary['p'] = df_summary['conv'] / df_summary['n_users']
-df_summary['col'] = pd.Series({'A': 'red', 'B':'blue'})
+groups = list(df_summary.index)
+baseline = groups[0]
+df_summary['col'] = pd.Series({gr: GROUP_COLORS[i % len(GROUP_COLORS)] for i, gr in enumerate(groups)})
 
 df_formatted = df_summary[[]].copy()
 df_formatted['Total Users'] = df_summary['n_users'].astype(str)
@@ -202,296 +468,116 @@ summary_bar.progress(0.1)
 
 df_plot = df_exp.set_index('group')
 
-fig = make_subplots(rows=1, cols=2, 
-                    column_widths=[0.85, 0.15],
-                    subplot_titles=("Daily", "Total"))
-for gr in df_plot.index.unique():
-    fig.add_trace(
-        go.Scatter(x=df_plot['day'][gr], y=df_plot['n_users'][gr], 
-                   line_color=df_summary['col'][gr],
-                   name=gr),
-        row=1, col=1
-    )
-    fig.add_trace(
-        go.Bar(x=[gr], y=[df_summary['n_users'][gr]],
-               marker_color=df_summary['col'][gr],
-               name=gr),
-        row=1, col=2
-    )
-fig.update_layout(title_text='Total Users')
-fig.update_xaxes(title_text="Days", row=1, col=1)
-fig.update_yaxes(title_text="N Users", row=1, col=1)
-fig.update_xaxes(title_text="Groups", row=1, col=2)
-fig.update_layout(yaxis_rangemode='tozero')
-st.plotly_chart(fig)
-
-
-fig = make_subplots(rows=1, cols=2, 
-                    column_widths=[0.85, 0.15],
-                    subplot_titles=("Daily", "Total"))
-for gr in df_plot.index.unique():
-    fig.add_trace(
-        go.Scatter(x=df_plot['day'][gr], y=df_plot['conv'][gr], 
-                   line_color=df_summary['col'][gr],
-                   name=gr),
-        row=1, col=1
-    )
-    fig.add_trace(
-        go.Bar(x=[gr], y=[df_summary['conv'][gr]],
-               marker_color=df_summary['col'][gr],
-               name=gr),
-        row=1, col=2
-    )
-fig.update_layout(title_text='Converted Users')
-fig.update_xaxes(title_text="Days", row=1, col=1)
-fig.update_yaxes(title_text="N Converted", row=1, col=1)
-fig.update_xaxes(title_text="Groups", row=1, col=2)
-fig.update_layout(yaxis_rangemode='tozero')
-st.plotly_chart(fig)
-
-
-df_accum = df.groupby('group')[['n_users', 'conv']].cumsum().rename(columns={'n_users': 'n_users_accum', 'conv':'conv_accum'})
-df = pd.concat([df, df_accum], axis=1)
-df['p_accum'] = df['conv_accum'] / df['n_users_accum']
-
-with st.spinner(text=f'Computing Conversions Interval Estimates ...'):
-    hpdi = 0.95
-    df[['p_hpdi_lower','p_hpdi_higher']] = df.apply(lambda row: pd.Series(hpdi_for_binom_and_uniform_prior(hpdi, row['conv_accum'], row['n_users_accum'])), axis=1)
-    df['error_lower'] = df['p_accum'] - df['p_hpdi_lower']
-    df['error_higher'] = df['p_hpdi_higher'] - df['p_accum']
+with profiler.stage('figures'):
+    st.plotly_chart(daily_and_total_figure(df_plot, df_summary, 'n_users', 'Total Users', "N Users"))
+with profiler.stage('figures'):
+    st.plotly_chart(daily_and_total_figure(df_plot, df_summary, 'conv', 'Converted Users', "N Converted"))
+
+
+if stored is None:
+    df_accum = df.groupby('group')[['n_users', 'conv']].cumsum().rename(columns={'n_users': 'n_users_accum', 'conv':'conv_accum'})
+    df = pd.concat([df, df_accum], axis=1)
+    df['p_accum'] = df['conv_accum'] / df['n_users_accum']
+
+    with st.spinner(text=f'Computing Conversions Interval Estimates ...'), profiler.stage('hpdi'):
+        hpdi = 0.95
+        df['p_hpdi_lower'], df['p_hpdi_higher'], hpdi_paths = hpdi_for_binom_and_uniform_prior(
+            hpdi, df['conv_accum'].to_numpy(), df['n_users_accum'].to_numpy())
+    profiler.count_paths('HPDI', hpdi_paths)
+else:
+    df = stored
+    hpdi = HPDI
+df['error_lower'] = df['p_accum'] - df['p_hpdi_lower']
+df['error_higher'] = df['p_hpdi_higher'] - df['p_accum']
 
 df_plot = df.set_index('group')
 df_summary[['p_error_lower', 'p_error_higher']] = df_plot[['error_lower', 'error_higher']][df_plot['day'] == df_plot['day'].max()]
 df_summary[['p_hpdi_lower', 'p_hpdi_higher']] = df_plot[['p_hpdi_lower', 'p_hpdi_higher']][df_plot['day'] == df_plot['day'].max()]
 
 
-fig = make_subplots(rows=1, cols=2,
-                    shared_yaxes=True,
-                    column_widths=[0.85, 0.15],
-                    subplot_titles=("Daily", "Total"))
-for gr in df_plot.index.unique():
-    fig.add_trace(
-        go.Scatter(x=df_plot['day'][gr], y=df_plot['p_accum'][gr],
-                   line_color=df_summary['col'][gr],
-                   name=gr),
-        row=1, col=1)
-    fig.add_trace(
-        go.Scatter(x=pd.concat([df_plot['day'][gr], df_plot['day'][gr][::-1], df_plot['day'][gr][0:1]]),
-                   y=pd.concat([df_plot['p_hpdi_higher'][gr], df_plot['p_hpdi_lower']
-                                [gr][::-1], df_plot['p_hpdi_higher'][gr][0:1]]),
-                   fill='toself', name=f'{hpdi:.0%} HPDI A',
-                   hoveron='points+fills',
-                   hoverinfo='text+x+y',
-                   line_color=df_summary['col'][gr], fillcolor=df_summary['col'][gr], opacity=0.4),
-        row=1, col=1)
-    fig.add_trace(
-        go.Scatter(x=[gr], y=[df_summary['p'][gr]],
-                   marker_color=df_summary['col'][gr],
-                   error_y={'array': [df_summary['p_error_higher'][gr]],
-                            'arrayminus': [df_summary['p_error_lower'][gr]]},
-                   name=gr),
-        row=1, col=2)
-fig.update_layout(title_text='Accumulated Conversions')
-fig.update_xaxes(title_text="Days", row=1, col=1)
-fig.update_yaxes(title_text="Conversions", row=1, col=1)
-fig.update_xaxes(title_text="Groups", row=1, col=2)
-fig.update_layout(yaxis_rangemode='tozero', yaxis2_rangemode='tozero')
-st.plotly_chart(fig)
+with profiler.stage('figures'):
+    st.plotly_chart(accumulated_conversions_figure(df_plot, df_summary, hpdi))
 
 summary_bar.progress(0.6)
 
 
 widedf = df.set_index(['group', 'day']).unstack(level=0)
-widedf['pb_gt_pa'] = widedf.apply(lambda row: prob_pb_gt_pa(
-    p_a=row['p_accum']['A'],
-    p_b=row['p_accum']['B'],
-    N_a=row['n_users_accum']['A'], 
-    N_b=row['n_users_accum']['B']), axis=1)
-widedf = widedf.reset_index()
-df_summary['p_best_group'] = pd.Series({'A': (1 - widedf['pb_gt_pa'].iloc[-1]), 'B':widedf['pb_gt_pa'].iloc[-1]})
-
-
-fig = make_subplots(rows=1, cols=2, 
-                    column_widths=[0.85, 0.15],
-                    subplot_titles=("Daily Accumulated", "Total"))
-fig.add_trace(go.Scatter(x=widedf.index, y=widedf['pb_gt_pa'],
-                         name='P(p_B > p_A)', marker_color='orange',
-                         opacity=0.6),
-              col=1, row=1)
-fig.add_hline(y=st.session_state['conv_pb_gt_pa_required'] / 100, line_dash="dash", col=1, row=1)
-fig.add_hline(y=1 - st.session_state['conv_pb_gt_pa_required'] / 100, line_dash="dash", col=1, row=1)
-for gr in df_summary.index.unique():
-    fig.add_trace(
-        go.Bar(x=[gr], y=[df_summary['p_best_group'][gr]],
-               name=gr,
-               marker_color=df_summary['col'][gr], width=0.3),
-        row=1, col=2)
-fig.update_layout(title_text='Certainty in Highest Conversion Group')
-fig.update_xaxes(title_text="Days", row=1, col=1)
-fig.update_yaxes(title_text="P(p_B > p_A)", row=1, col=1)
-fig.update_xaxes(title_text="Groups", row=1, col=2)
-fig.update_layout(yaxis_rangemode='tozero', yaxis2_rangemode='tozero')
-st.plotly_chart(fig)
-
+if stored is None:
+    with profiler.stage('certainty_curve'):
+        probs_best, certainty_paths = prob_best_group(widedf['conv_accum'][groups].to_numpy(),
+                                                      widedf['n_users_accum'][groups].to_numpy())
+        p_best_df = pd.DataFrame(probs_best, columns=groups).rename_axis('day')
+    profiler.count_paths('P(B>A)', certainty_paths)
+else:
+    p_best_df = widedf['p_best'][groups].reset_index(drop=True).rename_axis('day')
 
 n_sample = 100000
-post_sample_a = posterior_sample_for_binom_and_uniform_prior(df_summary['conv']['A'], df_summary['n_users']['A'], n_sample)
-post_sample_b = posterior_sample_for_binom_and_uniform_prior(df_summary['conv']['B'], df_summary['n_users']['B'], n_sample)
-post_sample_rel = post_sample_b / post_sample_a
+with profiler.stage('posterior_summary'):
+    post_summary = posterior_summary_for_groups(df_summary['conv'].to_numpy(), df_summary['n_users'].to_numpy(),
+                                                n_sample, hpdi, SEED)
+# the summary table shows the HPDI of the chart above and takes
+# everything else from the same sample
+df_summary['p_best_group'] = post_summary['p_best']
+
+
+st.number_input(label='Required Certainty',
+                min_value=0.0,
+                step=1.0,
+                format='%f',
+                key='conv_pb_gt_pa_required')
+pb_gt_pa_required = st.session_state['conv_pb_gt_pa_required'] / 100
+
+with profiler.stage('figures'):
+    st.plotly_chart(certainty_figure(p_best_df, df_summary, pb_gt_pa_required))
+
+post_sample_rels = {gr: post_summary['rel'][:, i] for i, gr in enumerate(groups) if gr != baseline}
 #pb_gt_pa = np.sum(post_sample_b > post_sample_a) / n_sample
 #df_summary['p_best_group'] = pd.Series({'A': (1 - pb_gt_pa), 'B':pb_gt_pa})
 #display(widedf.head())
 
-fig = go.Figure()
-p_grid = np.linspace(start=0, stop=1, num=3001)
-xaxis_min = np.nan
-xaxis_max = np.nan
-for gr in df_summary.index.unique():
-    post_dist = beta_post_dist(alpha=1, beta=1,
-                               n_conv=df_summary['conv'][gr],
-                               n_total=df_summary['n_users'][gr])
-    xaxis_min = np.nanmin([xaxis_min, post_dist.mean() - 5 * post_dist.std()])
-    xaxis_max = np.nanmax([xaxis_max, post_dist.mean() + 5 * post_dist.std()])
-    y_plot = post_dist.pdf(p_grid)
-    fig.add_trace(go.Scatter(x=p_grid, y=y_plot, mode='lines',
-                             name=gr,
-                             line_color=df_summary['col'][gr]))
-xaxis_min = np.floor(xaxis_min * 100) / 100
-xaxis_max = np.ceil(xaxis_max * 100) / 100
-fig.update_xaxes(range=[xaxis_min, xaxis_max])
-fig.update_layout(title='Conversions Prob Density Estimates',
-                  yaxis_title='Prob Density',
-                  xaxis_title='p',
-                  hovermode="x")
-st.plotly_chart(fig)
-
-
-fig = go.Figure()
-fig.add_trace(go.Histogram(x=post_sample_rel,
-                           histnorm='probability density',
-                           name='B/A', marker_color='orange',
-                           opacity=0.6))
-fig.add_vline(x=1, line_dash="dash")
-fig.update_layout(title='Conversions Relation',
-                  xaxis_title='p_B / p_A',
-                  yaxis_title='Prob Density',
-                  barmode='overlay')
-st.plotly_chart(fig)
+with profiler.stage('figures'):
+    st.plotly_chart(posterior_density_figure(df_summary))
+with profiler.stage('figures'):
+    st.plotly_chart(relation_figure(post_sample_rels, df_summary, baseline))
 
 
 df_formatted['Mean Conversion, %'] = np.round(df_summary['p'] * 100, 1).astype(str)
 #df_formatted['Conversion 95HPDI, %'] = df_summary.apply(lambda row: f"{row['p_hpdi_lower'] * 100 :.1f} - {row['p_hpdi_higher'] * 100:.1f}", axis=1)
 #df_formatted['p (95 HPDI), %'] = df_summary.apply(lambda row: f"{row['p'] * 100 :.1f} ({row['p_hpdi_lower'] * 100 :.1f} - {row['p_hpdi_higher'] * 100:.1f})", axis=1)
-df_formatted['Relative to A'] = pd.Series({'A':1.0, 'B':np.mean(post_sample_rel).round(2)}).astype(str)
+df_formatted[f'{hpdi:.0%} HPDI, %'] = [f"{lower * 100:.1f} - {upper * 100:.1f}"
+                                       for lower, upper in zip(df_summary['p_hpdi_lower'], df_summary['p_hpdi_higher'])]
+df_formatted[f'Relative to {baseline}'] = np.round(post_summary['rel_mean'], 2).astype(str)
 summary_bar.progress(0.8)
 
 df_formatted['Prob(Highest Conversion), %'] = np.round(df_summary['p_best_group'] * 100, 1).astype(str)
+df_formatted['Expected Loss, %'] = np.round(post_summary['expected_loss'] * 100, 2).astype(str)
 summary_bar.progress(1)
 summary_bar.empty()
 summary_container.table(df_formatted.T)
 
-
-st.subheader("Duration Estimates")
-
-col1, col2 = st.columns(2)
-with col1: 
-    st.number_input(label='Max Days in Simulations',
-                    min_value=1,
-                    step=1,
-                    format='%d',
-                    key='conv_sim_max_days')
-with col2: 
-    st.number_input(label='Simulations',
-                    min_value=1,
-                    step=1,
-                    format='%d',
-                    key='conv_n_simulations')
-
-st.number_input(label='Required Certainty',
-                min_value=0.0,
-                step=1.0,
-                format='%f',
-                key='conv_pb_gt_pa_required')
-
-n_simulations = st.session_state['conv_n_simulations']
-pb_gt_pa_required = st.session_state['conv_pb_gt_pa_required'] / 100
-
-
-
-
-
-
-
-
-
-a_alpha_post, a_beta_post = alpha_beta_post(alpha=1, beta=1,
-                                            n_conv=df_summary['conv']['A'], 
-                                            n_total=df_summary['n_users']['A'])
-b_alpha_post, b_beta_post = alpha_beta_post(alpha=1, beta=1,
-                                            n_conv=df_summary['conv']['B'], 
-                                            n_total=df_summary['n_users']['B'])
-a_post = stats.beta(a_alpha_post, a_beta_post)
-b_post = stats.beta(b_alpha_post, b_beta_post)
-a_p_sim = a_post.rvs(n_simulations)
-b_p_sim = b_post.rvs(n_simulations)
-
-trials = np.append(0, np.full(fill_value=st.session_state['conv_daily_users'],
-                              shape=st.session_state['conv_sim_max_days']))
-a_trials = np.rint(trials * (1 - conv_b_split)).astype(int)
-b_trials = np.rint(trials * conv_b_split).astype(int)
-
-i = 0
-with st.spinner(text=f'Running {n_simulations} simulations ...'):
-    my_bar = st.progress(0)
-    sims = []
-    for a_p, b_p in zip(a_p_sim, b_p_sim):
-        s = {}
-        s['A'] = simulate(a_p, a_trials, a_alpha_post, a_beta_post)
-        s['B'] = simulate(b_p, b_trials, b_alpha_post, b_beta_post)
-        s['pb_ge_pa'] = pb_ge_pa_sims(s['A'], s['B'], n_cmp=10000)
-        s['days'] = np.arange(st.session_state['conv_sim_max_days'] + 1)
-        s['N'] = s['A']['trials_accum'] + s['B']['trials_accum']
-        s['pb_gt_pa_required'] = st.session_state['conv_pb_gt_pa_required'] / 100
-        s['min_days_to_reach_certainty_lvl'] = min_days_to_reach_certainty_level(s['pb_ge_pa'], s['days'], s['pb_gt_pa_required'])
-        sims.append(s)
-        i = i + 1
-        my_bar.progress(i / n_simulations)
-my_bar.empty()
-
-n_reached_hist = [s['min_days_to_reach_certainty_lvl'] for s in sims]
-n_reached_freqs = pd.Series(n_reached_hist).value_counts(normalize=True).rename('freq').to_frame()
-x_med = np.median(n_reached_hist)
-if len(n_reached_freqs['freq']) == 1:
-    summary_line = f"100% simulations reached certainty at day {n_reached_freqs.index[0]}"
+if len(groups) == 2:
+    current_line = f"Current P(p_{groups[1]} > p_{baseline}): {post_summary['p_gt_baseline'][1] * 100:.1f}%"
 else:
-    summary_line = f"50% simulations reached {pb_gt_pa_required*100:.0f}% certainty at additional day {x_med:.0f} or earlier"
-
+    current_line = "Current P(best): " + ", ".join(
+        f"{gr} {p * 100:.1f}%" for gr, p in df_summary['p_best_group'].items())
 summary_container.write(f"""
-    Current P(p_B > p_A): {df_summary['p_best_group']['B'] * 100:.1f}%    
+    {current_line}    
     Required certainty: {st.session_state['conv_pb_gt_pa_required']}%  
-    {summary_line}
 """)
 
-fig = go.Figure()
-fig.add_trace(go.Bar(x=n_reached_freqs.index,
-                     y=n_reached_freqs['freq'],
-                     width=[1] * len(n_reached_freqs),
-                     marker_color='red',
-                     opacity=0.6,
-                     name='Simulations Reached Certainty'))
-fig.add_trace(go.Scatter(x=[x_med, x_med], y=[0, np.max(n_reached_freqs['freq'])], 
-                         line_color='black',
-                         line_dash='dash',
-                         mode='lines',
-                         hovertemplate=f"Median: {x_med}",
-                         name='Median'))              
-fig.update_layout(title=f'Additional Days to Reach {pb_gt_pa_required*100:.0f}% Certainty')
-fig.update_layout(xaxis_title='Additional Days',
-                  yaxis_title='Part from Total Simulations',
-                  showlegend=False)
-fig.update_xaxes(range=[0, st.session_state['conv_sim_max_days'] + 1])
-fig.update_layout(yaxis_rangemode='tozero')
-st.plotly_chart(fig)
+
+alphas_post, betas_post = alpha_beta_post(alpha=1, beta=1,
+                                          n_conv=df_summary['conv'].to_numpy(),
+                                          n_total=df_summary['n_users'].to_numpy())
+duration_estimates(groups, alphas_post, betas_post, daily_users, splits, pb_gt_pa_required)
+
+if profiler.enabled:
+    record = profiler.finish('Conversions Comparison')
+    with st.expander("Diagnostics"):
+        st.dataframe(pd.DataFrame(record['stages']).set_index('stage').round(3))
+        st.caption(f"Total {record['total_seconds']:.2f} s")
+        for line in profiler.path_shares():
+            st.caption(line)
 
 st.markdown('---')
 st.write("Sources: https://github.com/noooway/Coinflip")
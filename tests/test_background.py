@@ -0,0 +1,64 @@
+import threading
+
+import pytest
+
+from coinflip import background
+from coinflip.background import Cancelled, shared_run
+
+
+def blocking_task(started, release):
+    def task(progress):
+        started.set()
+        while not release.wait(0.01):
+            progress(0.5)
+        progress(1.0)
+        return 'done'
+    return task
+
+
+def leave(fraction_done):
+    # a script thread stopped by a rerun
+    raise KeyboardInterrupt()
+
+
+def test_waiters_with_the_same_key_share_one_run():
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def task(progress):
+        calls.append(1)
+        return blocking_task(started, release)(progress)
+
+    results = []
+    waiters = [threading.Thread(target=lambda: results.append(shared_run('same', task))) for _ in range(2)]
+    for t in waiters:
+        t.start()
+    started.wait(5)
+    release.set()
+    for t in waiters:
+        t.join(5)
+    assert results == ['done', 'done']
+    assert calls == [1]
+
+
+def test_rerun_attaches_to_the_run_it_left():
+    started, release = threading.Event(), threading.Event()
+    task = blocking_task(started, release)
+
+    with pytest.raises(KeyboardInterrupt):
+        shared_run('rerun', task, on_progress=leave, interval=0.01, linger=5)
+    started.wait(5)
+    threading.Timer(0.1, release.set).start()
+    assert shared_run('rerun', lambda progress: 'restarted') == 'done'
+
+
+def test_run_without_waiters_is_cancelled_after_linger():
+    started, release = threading.Event(), threading.Event()
+    task = blocking_task(started, release)
+
+    with pytest.raises(KeyboardInterrupt):
+        shared_run('left', task, on_progress=leave, interval=0.01, linger=0.05)
+    started.wait(5)
+    with pytest.raises(Cancelled):
+        background._runs['left'].future.result(timeout=5)
+    release.set()
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from coinflip.batch import RESULT_COLUMNS, evaluate_experiments
+
+
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_bad_row_does_not_abort_batch(n_workers):
+    experiments = pd.DataFrame({
+        'a_mean': [0.15, 0.15, np.nan],
+        'a_std': [0.01, 0.01, np.nan],
+        'b_mean': [0.16, 0.16, np.nan],
+        'b_std': [0.01, 0.01, np.nan],
+        'n_simulations': [20, 20, 20],
+    })
+    results = evaluate_experiments(experiments, n_workers=n_workers)
+
+    assert len(results) == 3
+    assert results.loc[:1, RESULT_COLUMNS].notna().all().all()
+    assert results.loc[:1, 'error'].isna().all()
+    assert results.loc[2, RESULT_COLUMNS].isna().all()
+    assert 'ValueError' in results.loc[2, 'error']
+
+
+def test_adaptive_rows_report_the_standard_error():
+    experiments = pd.DataFrame({
+        'a_conv': [150, 150],
+        'a_users': [1000, 1000],
+        'b_conv': [165, 165],
+        'b_users': [1000, 1000],
+        'n_simulations': [10, 10],
+        'method': ['quad', 'adaptive'],
+    })
+    results = evaluate_experiments(experiments, n_workers=1)
+
+    assert results.loc[0, 'p_best_se'] == 0
+    quad, adaptive = results['p_best_b']
+    se = results.loc[1, 'p_best_se']
+    assert se > 0
+    assert abs(adaptive - quad) < 5 * se
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from coinflip import cache
+from coinflip.cache import CACHE_ENV, cache_get, cache_key, cache_put, disk_cached, open_cache
+
+KB = 2**-10
+
+
+def counted(calls):
+    def simulate(n, seed, n_workers=1, executor='thread', progress=None):
+        calls.append(n)
+        return np.arange(n, dtype=float) + seed
+    return simulate
+
+
+@pytest.fixture
+def path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'cache.sqlite')
+    monkeypatch.setenv(CACHE_ENV, path)
+    return path
+
+
+def stored_keys(path):
+    con = open_cache(path)
+    try:
+        return {key for key, in con.execute("SELECT key FROM results")}
+    finally:
+        con.close()
+
+
+def test_hit_and_miss(path):
+    calls = []
+    func = disk_cached(counted(calls))
+    np.testing.assert_array_equal(func(3, 1), [1, 2, 3])
+    np.testing.assert_array_equal(func(3, 1), [1, 2, 3])
+    assert calls == [3]
+    np.testing.assert_array_equal(func(3, 2), [2, 3, 4])
+    assert calls == [3, 3]
+    # a new wrapper of the same function reads the stored results
+    assert len(stored_keys(path)) == 2
+    disk_cached(counted(calls))(3, 1)
+    assert calls == [3, 3]
+
+
+def test_ignored_args_give_the_same_key(path):
+    calls = []
+    func = disk_cached(counted(calls))
+    func(3, 1)
+    func(3, 1, n_workers=4, executor='process', progress=print)
+    func(n=3, seed=1, n_workers=None)
+    assert calls == [3]
+
+
+def test_result_larger_than_the_cache_is_not_stored(path):
+    calls = []
+    func = disk_cached(counted(calls), max_mb=4 * KB)
+    func(1000, 0)
+    func(1000, 0)
+    assert calls == [1000, 1000]
+    assert stored_keys(path) == set()
+    func(10, 0)
+    func(10, 0)
+    assert calls == [1000, 1000, 10]
+
+
+def test_least_recently_used_entries_are_evicted(path):
+    con = open_cache(path)
+    value = np.zeros(100)
+    # room for two entries of about 0.9 KB
+    max_mb = 2 * KB
+    cache_put(con, 'a', 'f', value, max_mb)
+    cache_put(con, 'b', 'f', value, max_mb)
+    with con:
+        con.execute("UPDATE results SET last_access = 0")
+    # reading a makes b the least recently used entry
+    cache_get(con, 'a')
+    assert cache_put(con, 'c', 'f', value, max_mb) == 1
+    con.close()
+    assert stored_keys(path) == {'a', 'c'}
+
+
+def test_version_bump_invalidates_entries(path, monkeypatch):
+    calls = []
+    func = disk_cached(counted(calls))
+    func(3, 1)
+    key = cache_key('f', {'n': 3})
+    monkeypatch.setattr(cache, 'CACHE_VERSION', cache.CACHE_VERSION + 1)
+    assert cache_key('f', {'n': 3}) != key
+    func(3, 1)
+    assert calls == [3, 3]
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from coinflip.compare import QUAD_TOL, pb_gt_pa
+
+
+@pytest.mark.parametrize('a_alpha, a_beta, b_alpha, b_beta', [
+    # parameters below 1, densities unbounded at 0 and 1
+    ([0.3, 0.9, 0.05], [0.05, 0.5, 0.8], [1, 2, 3], [0.07, 0.9, 0.3]),
+    # rare conversions, no or a few conversions in a million trials
+    ([1, 1, 3], [1e6, 3e5, 1e6], [2, 4, 1], [1e6, 5e5, 2e6]),
+])
+def test_quad_matches_exact_for_small_parameters(a_alpha, a_beta, b_alpha, b_beta):
+    params = [np.asarray(x, dtype=float) for x in (a_alpha, a_beta, b_alpha, b_beta)]
+    quad = pb_gt_pa(*params, method='quad')
+    exact = pb_gt_pa(*params, method='exact')
+    assert np.all(np.abs(quad - exact) < QUAD_TOL)
+
+
+# posterior pairs with P(B > A) from 0.6 to nearly 1
+MC_PARAMS = ([20, 200, 2, 50], [180, 1800, 10, 950], [22, 230, 3, 80], [178, 1770, 9, 920])
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_mc_does_not_depend_on_chunk_size(dtype):
+    params = [np.asarray(x, dtype=float) for x in MC_PARAMS]
+    n_cmp = 5000
+    one_chunk = pb_gt_pa(*params, method='mc', n_cmp=n_cmp, random_state=7,
+                         chunk_size=n_cmp * len(MC_PARAMS[0]), dtype=dtype)
+    chunked = pb_gt_pa(*params, method='mc', n_cmp=n_cmp, random_state=7,
+                       chunk_size=1000, dtype=dtype)
+    np.testing.assert_array_equal(chunked, one_chunk)
+
+
+def test_mc_float32_error_is_within_sampling_error():
+    # float32 draws round p to about 6e-8, far below the std error
+    # sqrt(p (1 - p) / n_cmp), so the estimate stays within 5 of them
+    params = [np.asarray(x, dtype=float) for x in MC_PARAMS]
+    n_cmp = 20000
+    exact = pb_gt_pa(*params, method='exact')
+    mc = pb_gt_pa(*params, method='mc', n_cmp=n_cmp, random_state=3, dtype=np.float32)
+    se = np.sqrt(np.maximum(exact * (1 - exact), 0.25 / n_cmp) / n_cmp)
+    assert np.all(np.abs(mc - exact) < 5 * se)
@@ -0,0 +1,19 @@
+import io
+
+from coinflip.ingest import aggregate_user_log
+
+
+def test_header_only_csv_gives_empty_table():
+    df = aggregate_user_log(io.StringIO('group,day,converted\n'))
+
+    assert df.empty
+    assert list(df.columns) == ['group', 'day', 'n_users', 'conv']
+
+
+def test_days_without_users_get_rows():
+    log = io.StringIO('group,day,converted\nA,0,1\nB,0,0\nA,2,0\n')
+    df = aggregate_user_log(log)
+
+    assert len(df) == 6
+    assert df['n_users'].sum() == 3
+    assert df['conv'].sum() == 1
@@ -0,0 +1,15 @@
+import numpy as np
+
+from coinflip.lookup import REACHED_MARGIN, TABLE_PATH, check_error, interpolate_durations, load_table
+
+
+def test_quantiles_not_reached_in_time_are_not_reported():
+    table = load_table(TABLE_PATH)
+    # about 89% of the simulations reach 95% certainty within 30 days
+    estimate = interpolate_durations(table, 0.15, 1 / 15, 0.001, 0.01, 5000, 0.5, 0.95)
+
+    assert np.array_equal(estimate['reported'],
+                          table['quantiles'] <= estimate['reached_share'] - REACHED_MARGIN)
+    assert not estimate['reported'][-1]
+    for q in table['quantiles'][estimate['reported']]:
+        assert np.quantile(check_error(table, q), 0.95) < 3
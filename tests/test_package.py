@@ -0,0 +1,17 @@
+import subprocess
+import sys
+
+
+def test_compute_modules_import_without_pandas():
+    code = ("import sys, coinflip, coinflip.simulation, coinflip.lookup; "
+            "from coinflip import pb_gt_pa, beta_hpdi; "
+            "assert 'pandas' not in sys.modules")
+    subprocess.run([sys.executable, '-c', code], check=True)
+
+
+def test_reexports_load_on_access():
+    import coinflip
+    from coinflip.store import open_store
+
+    assert coinflip.open_store is open_store
+    assert 'evaluate_experiments' in dir(coinflip)
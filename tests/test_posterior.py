@@ -0,0 +1,15 @@
+import numpy as np
+
+from coinflip.posterior import HPDI_NORMAL_TOL, beta_hpdi
+
+
+def test_normal_hpdi_of_rare_conversions_stays_close_to_bisection():
+    # skewed posteriors with narrow intervals near 0
+    alpha = np.array([1, 2, 3, 11, 1500])
+    beta = np.array([1e6, 1e6, 3e5, 1e5, 1e4])
+    lower, upper = beta_hpdi(0.95, alpha, beta, normal_tol=HPDI_NORMAL_TOL)
+    exact_lower, exact_upper = beta_hpdi(0.95, alpha, beta)
+
+    assert np.all(lower >= 0)
+    error = np.maximum(np.abs(lower - exact_lower), np.abs(upper - exact_upper))
+    assert np.all(error <= HPDI_NORMAL_TOL * (exact_upper - exact_lower))
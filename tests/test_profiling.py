@@ -0,0 +1,34 @@
+import gc
+import tracemalloc
+
+from coinflip.profiling import Profiler
+
+
+def test_tracing_stops_with_the_last_profiler():
+    first, second = Profiler(enabled=True), Profiler(enabled=True)
+    first.finish('first')
+    assert tracemalloc.is_tracing()
+
+    with second.stage('allocate'):
+        data = bytearray(2**20)
+    assert second.stages['allocate']['peak_mb'] >= 1
+    second.finish('second')
+    assert not tracemalloc.is_tracing()
+    del data
+
+
+def test_unfinished_profiler_releases_tracing_when_collected():
+    profiler = Profiler(enabled=True)
+    assert tracemalloc.is_tracing()
+    del profiler
+    gc.collect()
+    assert not tracemalloc.is_tracing()
+
+
+def test_finish_twice_releases_once():
+    first, second = Profiler(enabled=True), Profiler(enabled=True)
+    first.finish('first')
+    first.finish('first')
+    assert tracemalloc.is_tracing()
+    second.finish('second')
+    assert not tracemalloc.is_tracing()
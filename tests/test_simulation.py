@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from coinflip import simulation
+from coinflip.simulation import (SIMULATIONS_PER_STREAM, duration_simulations, min_days_incremental,
+                                 min_days_to_reach_certainty_level, pb_ge_pa_sims, run_duration_simulations,
+                                 simulate)
+
+REQUIRED = 0.9
+
+
+def trajectories(n_simulations=200, days=15, seed=1):
+    # groups close enough that some simulations cross the threshold and fall back
+    rng = np.random.default_rng(seed)
+    trials = np.full(days, 200)
+    s_a = simulate(rng.beta(20, 180, n_simulations), trials, 1, 1, random_state=rng)
+    s_b = simulate(rng.beta(22, 178, n_simulations), trials, 1, 1, random_state=rng)
+    return s_a, s_b, np.arange(days), pb_ge_pa_sims(s_a, s_b)
+
+
+def test_int_seed_draws_differ_between_groups_and_blocks(monkeypatch):
+    # one simulation per block
+    monkeypatch.setattr(simulation, 'ELEMENTS_PER_BLOCK', 1)
+    p = np.full(4, 0.1)
+    trials = np.full(20, 1000)
+    sims = duration_simulations(p, p, trials, trials, 1, 1, 1, 1, random_state=0)
+
+    a, b = sims['A']['trials_conv_accum'], sims['B']['trials_conv_accum']
+    assert not np.array_equal(a, b)
+    assert len({tuple(row) for row in a}) == len(a)
+
+
+def test_last_day_rule_matches_full_trajectories():
+    s_a, s_b, days, pb_ge_pa = trajectories()
+    min_days, reached = min_days_incremental(s_a, s_b, days, REQUIRED, stopping='last_day')
+
+    expected = min_days_to_reach_certainty_level(pb_ge_pa, days, REQUIRED)
+    assert np.array_equal(min_days, expected)
+    last = pb_ge_pa[:, -1]
+    assert np.array_equal(reached, (last > REQUIRED) | (last < 1 - REQUIRED))
+
+
+def test_sequential_rule_stops_at_the_first_crossing():
+    s_a, s_b, days, pb_ge_pa = trajectories()
+    min_days, reached = min_days_incremental(s_a, s_b, days, REQUIRED, stopping='sequential')
+
+    crossed = (pb_ge_pa > REQUIRED) | (pb_ge_pa < 1 - REQUIRED)
+    assert np.array_equal(reached, crossed.any(axis=-1))
+    assert np.array_equal(min_days, np.where(crossed.any(axis=-1), days[np.argmax(crossed, axis=-1)],
+                                             days[-1]))
+    # some simulations cross and fall back, so the rules differ
+    assert np.any(crossed.any(axis=-1) & ~crossed[:, -1])
+
+
+@pytest.mark.parametrize('n_workers, executor', [(4, 'thread'), (4, 'process')])
+def test_results_do_not_depend_on_workers_or_executor(n_workers, executor):
+    # several chunks, each with its own stream
+    args = (20, 180, 22, 178, 400, 0.5, 10, 2 * SIMULATIONS_PER_STREAM + 10, 3)
+    kwargs = {'pb_gt_pa_required': REQUIRED, 'trajectories': False}
+    serial = run_duration_simulations(*args, n_workers=1, **kwargs)
+    parallel = run_duration_simulations(*args, n_workers=n_workers, executor=executor, **kwargs)
+
+    for key in ('pb_ge_pa', 'min_days_to_reach_certainty_lvl'):
+        assert np.array_equal(serial[key], parallel[key])
+    for group in ('A', 'B'):
+        assert np.array_equal(serial[group]['p'], parallel[group]['p'])
+
+
+class Stop(Exception):
+    pass
+
+
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_sweep_reports_progress_and_stops_within_a_chunk(n_workers):
+    args = (20, 180, 22, 178, [200, 400], [0.5], 20, 2 * SIMULATIONS_PER_STREAM, 3, REQUIRED)
+    reports = []
+    simulation.run_duration_sweep(*args, n_workers=n_workers, progress=reports.append)
+    # more than one report per chunk of simulations
+    assert len(reports) > 2 * 2
+    assert reports == sorted(reports) and reports[-1] == 1
+
+    calls = []
+
+    def stop_midway(fraction_done):
+        calls.append(fraction_done)
+        if len(calls) == 3:
+            raise Stop()
+
+    with pytest.raises(Stop):
+        simulation.run_duration_sweep(*args, n_workers=n_workers, progress=stop_midway)
+    assert max(calls) < 1
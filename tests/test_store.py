@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from coinflip import store
+from coinflip.store import append_days, open_store, read_experiment, update_experiment
+
+
+def daily_counts(n_days, conv=10):
+    return pd.DataFrame({'group': np.repeat(['A', 'B'], n_days),
+                         'day': np.tile(np.arange(n_days), 2),
+                         'n_users': 100,
+                         'conv': conv})
+
+
+def test_changed_stored_days_are_recomputed(tmp_path):
+    con = open_store(tmp_path / 'store.db')
+    df = daily_counts(20)
+    assert update_experiment(con, 'exp', df) == 20
+    assert update_experiment(con, 'exp', df) == 0
+
+    # late conversions on the last logged day and a new day
+    df = daily_counts(21)
+    df.loc[(df['group'] == 'B') & (df['day'] == 19), 'conv'] += 50
+    assert update_experiment(con, 'exp', df) == 2
+
+    stored = read_experiment(con, 'exp').set_index(['group', 'day'])
+    assert stored.loc[('B', 19), 'conv'] == 60
+    assert stored.loc[('B', 20), 'conv_accum'] == 21 * 10 + 50
+    assert len(stored) == 42
+
+
+def test_concurrent_append_of_the_same_day(tmp_path, monkeypatch):
+    first, second = open_store(tmp_path / 'store.db'), open_store(tmp_path / 'store.db')
+    update_experiment(first, 'exp', daily_counts(5))
+    new_day = daily_counts(6)
+    new_day = new_day[new_day['day'] == 5]
+    # the second session read the last stored day before the first appended
+    append_days(first, 'exp', new_day)
+    monkeypatch.setattr(store, 'last_day', lambda con, experiment: 4)
+    append_days(second, 'exp', new_day)
+
+    assert len(read_experiment(first, 'exp')) == 12